@@ -8,6 +8,7 @@ import dearpygui.dearpygui as dpg
 from src.editor import node_editor
 from src.utils import AlignmentType, auto_align, fd, history_manager, resource, toaster
 from src.utils import ImageController as dpg_img
+from src.utils.nodes import update
 from src.utils.paths import general_path
 
 config = configparser.ConfigParser()
@@ -46,17 +47,26 @@ def export(info):
         filename += extension
 
     location = os.path.join(location, filename)
-    image = dpg.get_item_user_data("Output").pillow_image
+    images = update.render()
+    if not images:
+        toaster.show("Export Output", "The output node isn't connected.")
+        return
 
+    # Extra outputs are saved next to the main one with their tag added to the name
+    locations = {tag: location[: -len(extension)] + "_" + tag.lower() + extension for tag in images}
+    locations["Output"] = location
     try:
-        image.save(location)
+        for tag, image in images.items():
+            image.save(locations[tag])
     except ValueError:
         toaster.show("Export Output", "Invalid location specified.")
         return
+
+    tag = "Output" if "Output" in images else next(iter(images))
     if sys.platform == "win32":
-        webbrowser.open(location)
+        webbrowser.open(locations[tag])
     else:
-        image.show()
+        images[tag].show()
 
 
 with dpg.window(
@@ -79,6 +89,7 @@ with dpg.window(
 ):
     dpg.add_button(label="Delete node", callback=node_editor.delete_nodes)
     dpg.add_button(label="Duplicate node", callback=node_editor.duplicate_nodes)
+    dpg.add_button(label="Freeze node", callback=node_editor.freeze_nodes)
 
 with dpg.window(
     tag="manual_modal",
@@ -95,6 +106,7 @@ with dpg.window(
     dpg.add_text("To add a link, drag from an output to an input.", bullet=True)
     dpg.add_text("To set an exact value on a slider, Ctrl+Click it.", bullet=True)
     dpg.add_text("To duplicate nodes, select them and press Ctrl+V.", bullet=True)
+    dpg.add_text("To stop a slow node from running again while editing the ones after it, freeze it.", bullet=True)
     dpg.add_text("To export the output, press Ctrl+E.", bullet=True)
 
 
@@ -184,10 +196,12 @@ with dpg.window(
             dpg.add_menu_item(label="Redo    ", tag="redo", shortcut="Ctrl+Y", callback=history_manager.redo)
 
         with dpg.menu(tag="nodes", label="Nodes"):
-            for idx, module in enumerate(node_editor.modules[1:]):
+            for idx, module in enumerate(node_editor.modules[1:-1]):
                 dpg.add_menu_item(tag=module.name, label=module.name, callback=module.new)
                 if module.is_plugin and not node_editor.modules[idx + 2].is_plugin:
                     dpg.add_separator()
+            # The "Output" tag belongs to the main Output node
+            dpg.add_menu_item(tag="Output_menu", label="Output", callback=node_editor.modules[-1].new)
 
         with dpg.menu(tag="help", label="Help"):
             dpg.add_menu_item(
@@ -227,12 +241,14 @@ dpg.show_viewport()
 dpg.maximize_viewport()
 dpg.set_primary_window("Cresliant", True)
 
-if node_editor.debug:
-    # This makes debuggers actually work by stopping at breakpoints
-    while dpg.is_dearpygui_running():
+while dpg.is_dearpygui_running():
+    if node_editor.debug:
+        # This makes debuggers actually work by stopping at breakpoints
         jobs = dpg.get_callback_queue()
         dpg.run_callbacks(jobs)
-        dpg.render_dearpygui_frame()
 
-dpg.start_dearpygui()
+    # Renders happen in the background, finished ones are swapped in between frames
+    update.present()
+    dpg.render_dearpygui_frame()
+
 dpg.destroy_context()
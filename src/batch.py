@@ -0,0 +1,171 @@
+"""Applies a saved .cresliant project to many images without opening the editor.
+
+Usage: python -m src.batch project.cresliant INPUT [INPUT ...] -o OUTPUT [options]
+
+Inputs can be image files, directories or glob patterns. No DearPyGui context is created,
+so this can run on machines without a display.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from src.modules import headless_modules
+from src.pipeline import DiskCache, Executor, Pipeline, Plan, native, parse_size
+
+_pipeline = None
+_executor = None
+
+
+def load_pipeline(location):
+    with open(location) as file:
+        pipeline = Pipeline.load(json.load(file), headless_modules())
+
+    if not pipeline.chains():
+        raise ValueError(f"{location}: the Input isn't connected to an Output.")
+    return pipeline
+
+
+def find_images(inputs):
+    extensions = Image.registered_extensions()
+    seen = set()
+    for location in inputs:
+        if os.path.isdir(location):
+            found = [
+                os.path.join(location, file)
+                for file in sorted(os.listdir(location))
+                if os.path.splitext(file)[1].lower() in extensions
+            ]
+        elif os.path.isfile(location):
+            found = [location]
+        else:
+            found = sorted(glob.glob(location, recursive=True))
+
+        # The same image can be matched by several inputs, it's only rendered once
+        for file in found:
+            if os.path.normcase(os.path.abspath(file)) not in seen:
+                seen.add(os.path.normcase(os.path.abspath(file)))
+                yield file
+
+
+def find_conflicts(jobs):
+    # Inputs whose results would be written to a file another input already writes to
+    destinations = {}
+    conflicts = []
+    for location, paths in jobs:
+        for path in paths.values():
+            key = os.path.normcase(os.path.abspath(path))
+            if key in destinations:
+                conflicts.append((destinations[key], location, path))
+            else:
+                destinations[key] = location
+    return conflicts
+
+
+def output_paths(location, directory, pattern, extension, index, outputs):
+    stem, source_extension = os.path.splitext(os.path.basename(location))
+    paths = {}
+    for output in outputs:
+        name = pattern.format(stem=stem, ext=source_extension[1:], index=index, output=output.lower())
+        # Keep the files of extra outputs apart even if the pattern doesn't mention them
+        if output != "Output" and "{output}" not in pattern:
+            name += "_" + output.lower()
+        paths[output] = os.path.join(directory, name + "." + (extension or source_extension[1:]))
+    return paths
+
+
+def _init(location, cache=None, cache_size=None):
+    global _pipeline, _executor
+    _pipeline = Plan(load_pipeline(location))
+    _executor = Executor(disk=DiskCache(cache, cache_size) if cache else None)
+
+
+def _render(job):
+    location, destinations = job
+    try:
+        images = _executor.run(_pipeline, native(Image.open(location)))
+        for output, image in images.items():
+            try:
+                image.save(destinations[output])
+            except OSError:
+                # Formats like JPEG can't store an alpha channel
+                image.convert("RGB").save(destinations[output])
+    except Exception:
+        return location, traceback.format_exc()
+    return location, None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m src.batch", description=__doc__.splitlines()[0])
+    parser.add_argument("project", help="the .cresliant project to apply")
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="directory to write the results to")
+    parser.add_argument(
+        "-n",
+        "--name",
+        default="{stem}",
+        help="pattern for the output file names, can use {stem}, {ext}, {index} and {output} (default: %(default)s)",
+    )
+    parser.add_argument("-f", "--format", default="png", help="output file extension, empty keeps the source's")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument(
+        "--cache",
+        default=os.environ.get("CRESLIANT_CACHE"),
+        help="directory to keep rendered images in, so they aren't rendered again (default: $CRESLIANT_CACHE)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=parse_size,
+        default=os.environ.get("CRESLIANT_CACHE_SIZE", "2G"),
+        help="size the cache is kept under, like 500M or 10G (default: $CRESLIANT_CACHE_SIZE or 2G)",
+    )
+    args = parser.parse_args(args)
+
+    try:
+        outputs = list(load_pipeline(args.project).chains())
+    except (OSError, ValueError, KeyError) as error:
+        print("Error:", error)
+        return 1
+
+    extension = args.format.lstrip(".").lower()
+    jobs = [
+        (location, output_paths(location, args.output, args.name, extension, index, outputs))
+        for index, location in enumerate(find_images(args.inputs))
+    ]
+    if not jobs:
+        print("Error: no input images found.")
+        return 1
+
+    conflicts = find_conflicts(jobs)
+    if conflicts:
+        for first, second, path in conflicts:
+            print(f"Error: {first} and {second} would both be written to {path}.")
+        print("Use {index} or {ext} in --name to give them different names.")
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(
+        max(args.jobs, 1), initializer=_init, initargs=(args.project, args.cache, args.cache_size)
+    ) as executor:
+        chunksize = max(len(jobs) // (max(args.jobs, 1) * 16), 1)
+        for done, (location, error) in enumerate(executor.map(_render, jobs, chunksize=chunksize), 1):
+            if error:
+                failed += 1
+                print(f"[{done}/{len(jobs)}] Failed: {location}\n{error}", file=sys.stderr)
+            else:
+                print(f"[{done}/{len(jobs)}] {location}")
+
+    print(f"Rendered {len(jobs) - failed} of {len(jobs)} images.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,9 @@
 from dearpygui import dearpygui as dpg
 from PIL import Image
 
+from src.pipeline import native
 from src.utils import ImageController as dpg_img
-from src.utils import fd, theme, toaster
+from src.utils import fd, node_registry, theme, toaster
 from src.utils.nodes import NodeParent
 from src.utils.paths import resource
 
@@ -26,7 +27,8 @@ class InputModule(NodeParent):
             toaster.show("Input", "Invalid image file.")
             return
 
-        image = image.convert("RGBA")
+        # Kept in its own mode, grayscale and opaque images don't need all four bands
+        image = native(image)
         self.image = image.copy()
         self.image_path = path
         image.thumbnail((450, 450), Image.LANCZOS)
@@ -50,3 +52,4 @@ class InputModule(NodeParent):
             )
 
         dpg.bind_item_theme("Input", theme.red)
+        node_registry.add("Input", self)
@@ -1,7 +1,9 @@
+from contextlib import suppress
+
 from dearpygui import dearpygui as dpg
-from PIL import Image
 
-from src.utils import theme
+from src.utils import find_available_pos, history_manager, node_registry, theme
+from src.utils.nodes import HistoryItem
 
 
 class OutputModule:
@@ -9,14 +11,21 @@ class OutputModule:
     tooltip = "Image output"
 
     def __init__(self, image):
-        self.counter = 0
+        self.counter = 1
         self.image = image
-        self.pillow_image = Image.new("RGBA", (1, 1), (0, 0, 0, 0))
+        # The texture currently shown by each Output node, `image` is the main Output's
+        self.textures = {"Output": image}
+        # The float pixels last written to each texture, reused while the preview keeps its size
+        self.buffers = {}
+        self.settings = {"Output": {}}
         self.protected = True
         self.is_plugin = False
 
-    def new(self):
+    def new(self, history=True):
+        # The main Output always exists, adding another one creates an extra output that can be deleted again
         if dpg.does_item_exist("Output"):
+            if dpg.get_item_user_data("Output") is self:
+                return self.new_extra(history)
             dpg.delete_item("Output")
 
         with dpg.node(
@@ -29,3 +38,40 @@ class OutputModule:
             dpg.add_image(self.image)
 
         dpg.bind_item_theme("Output", theme.red)
+        node_registry.add("Output", self)
+
+    def new_extra(self, history=True):
+        tag = "Output_" + str(self.counter)
+        with dpg.node(
+            parent="MainNodeEditor",
+            tag=tag,
+            label="Output",
+            pos=find_available_pos(),
+            user_data=self,
+        ):
+            dpg.add_node_attribute(attribute_type=dpg.mvNode_Attr_Input, tag=tag + "_attribute")
+
+        dpg.bind_item_theme(tag, theme.red)
+        node_registry.add(tag, self)
+        self.settings[tag] = {}
+        self.textures[tag] = None
+        if history:
+            history_manager.append(
+                HistoryItem(
+                    tag=tag,
+                    action="new",
+                    data={"settings": self.settings[tag], "pos": dpg.get_item_pos(tag), "user_data": self},
+                )
+            )
+        self.counter += 1
+
+    def release(self, tag):
+        # Frees the texture and pixels of an extra Output once its node is deleted, the main one keeps its texture
+        if tag == "Output":
+            return
+        self.settings.pop(tag, None)
+        self.buffers.pop(tag, None)
+        texture = self.textures.pop(tag, None)
+        if texture:
+            with suppress(SystemError):
+                dpg.delete_item(texture)
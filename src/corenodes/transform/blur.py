@@ -1,6 +1,9 @@
+import math
+
 from dearpygui import dearpygui as dpg
 from PIL import Image, ImageFilter
 
+from src.pipeline.modes import NATIVE_MODES
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
@@ -8,6 +11,7 @@ from src.utils.nodes import NodeParent
 class BlurModule(NodeParent):
     name = "Blur"
     tooltip = "Blur image"
+    modes = NATIVE_MODES
 
     def __init__(self):
         super().__init__()
@@ -46,12 +50,54 @@ class BlurModule(NodeParent):
         self.settings[tag] = {"blur_mode_" + str(self.counter): "Gaussian", "blur_percentage_" + str(self.counter): 1}
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        if self.settings[tag]["blur_mode_" + tag.split("_")[-1]] == "Box":
-            return image.filter(
-                ImageFilter.BoxBlur(radius=self.settings[tag]["blur_percentage_" + tag.split("_")[-1]] / 50)
-            )
+    def scale(self, params, factor):
+        return {**params, "blur_percentage": params["blur_percentage"] * factor}
+
+    def footprint(self, params):
+        if params["blur_mode"] == "Box":
+            return math.ceil(params["blur_percentage"] / 50) + 1
+        # Gaussian blurs are done as three box blurs, which reach about three times the radius,
+        # plus a pixel of the reduced copy when it's blurred at a lower resolution
+        radius = params["blur_percentage"] / 65
+        return math.ceil(3 * radius) + 1 + reduction(radius)
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        if params["blur_mode"] == "Box":
+            return image.filter(ImageFilter.BoxBlur(radius=params["blur_percentage"] / 50))
+
+        return gaussian_blur(image, params["blur_percentage"] / 65)
+
+
+def reduction(radius):
+    # How much a Gaussian blur can be done smaller, while at least 2.5 pixels of blur are left after it
+    return int(radius / 2.5) if radius >= 5 else 0
+
+
+def gaussian_blur(image: Image.Image, radius: float) -> Image.Image:
+    # Large blurs run on a reduced copy that's scaled back up, within 5 levels of the full blur even on noise
+    factor = reduction(radius)
+    # Pillow's three box blurs reach at most this far, and repeat the edge pixels after each of them
+    reach = 3 * (math.ceil(radius) + 1)
+    width, height = image.size
+    if factor < 2 or min(image.size) < 4 * reach:
+        return image.filter(ImageFilter.GaussianBlur(radius))
+    if "A" in image.getbands():
+        # Reducing and resizing premultiply the alpha and Pillow's blur doesn't, so the bands are done one by one
+        return Image.merge(image.mode, [gaussian_blur(band, radius) for band in image.split()])
+
+    # Averaging blocks of factor x factor pixels already blurs by the variance of a box that wide
+    small = image.reduce(factor)
+    small = small.filter(ImageFilter.GaussianBlur(math.sqrt(radius**2 - (factor**2 - 1) / 12) / factor))
+    blurred = small.resize(image.size, Image.BILINEAR, (0, 0, width / factor, height / factor))
 
-        return image.filter(
-            ImageFilter.GaussianBlur(radius=self.settings[tag]["blur_percentage_" + tag.split("_")[-1]] / 65)
-        )
+    # A reduced copy can't repeat the edge pixels the same way, so the borders are blurred at full size.
+    # Strips twice as wide as the reach are exact in their outer half, where the cut doesn't reach
+    for strip, keep in (
+        ((0, 0, width, 2 * reach), (0, 0, width, reach)),
+        ((0, height - 2 * reach, width, height), (0, reach, width, 2 * reach)),
+        ((0, 0, 2 * reach, height), (0, 0, reach, height)),
+        ((width - 2 * reach, 0, width, height), (reach, 0, 2 * reach, height)),
+    ):
+        edge = image.crop(strip).filter(ImageFilter.GaussianBlur(radius)).crop(keep)
+        blurred.paste(edge, (strip[0] + keep[0], strip[1] + keep[1]))
+    return blurred
@@ -1,6 +1,9 @@
 from dearpygui import dearpygui as dpg
 from PIL import Image, ImageEnhance
 
+from src.pipeline.cache import EnhancerCache
+from src.pipeline.modes import NATIVE_MODES
+from src.pipeline.optimize import IDENTITY, blend_table
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
@@ -8,9 +11,13 @@ from src.utils.nodes import NodeParent
 class BrightnessModule(NodeParent):
     name = "Brightness"
     tooltip = "Adjust brightness"
+    modes = NATIVE_MODES
+
+    pointwise = True
 
     def __init__(self):
         super().__init__()
+        self.enhancers = EnhancerCache(ImageEnhance.Brightness)
 
     def new(self, history=True):
         with dpg.node(
@@ -38,7 +45,15 @@ class BrightnessModule(NodeParent):
         self.settings[tag] = {"brightness_percentage_" + str(self.counter): 1}
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        tag = tag.split("_")[-1]
-        percent = self.settings["brightness_" + tag]["brightness_percentage_" + tag]
-        return ImageEnhance.Brightness(image).enhance(percent / 25)
+    def identity(self, params, size):
+        return params["brightness_percentage"] == 25
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        return self.enhancers.get(image).enhance(params["brightness_percentage"] / 25)
+
+    def footprint(self, params):
+        return 0
+
+    def lut(self, params: dict, bands: tuple, mean) -> list:
+        table = blend_table(0, params["brightness_percentage"] / 25)
+        return [IDENTITY if band == "A" else table for band in bands]
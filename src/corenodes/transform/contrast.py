@@ -1,6 +1,9 @@
 from dearpygui import dearpygui as dpg
 from PIL import Image, ImageEnhance
 
+from src.pipeline.cache import EnhancerCache
+from src.pipeline.modes import NATIVE_MODES
+from src.pipeline.optimize import IDENTITY, blend_table
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
@@ -8,9 +11,13 @@ from src.utils.nodes import NodeParent
 class ContrastModule(NodeParent):
     name = "Contrast"
     tooltip = "Adjust contrast"
+    modes = NATIVE_MODES
+
+    pointwise = True
 
     def __init__(self):
         super().__init__()
+        self.enhancers = EnhancerCache(ImageEnhance.Contrast)
 
     def new(self, history=True):
         with dpg.node(
@@ -38,7 +45,12 @@ class ContrastModule(NodeParent):
         self.settings[tag] = {"contrast_percentage_" + str(self.counter): 1}
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        tag = tag.split("_")[-1]
-        percent = self.settings["contrast_" + tag]["contrast_percentage_" + tag]
-        return ImageEnhance.Contrast(image).enhance(percent / 25)
+    def identity(self, params, size):
+        return params["contrast_percentage"] == 25
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        return self.enhancers.get(image).enhance(params["contrast_percentage"] / 25)
+
+    def lut(self, params: dict, bands: tuple, mean) -> list:
+        table = blend_table(mean(), params["contrast_percentage"] / 25)
+        return [IDENTITY if band == "A" else table for band in bands]
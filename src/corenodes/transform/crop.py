@@ -1,6 +1,7 @@
 from dearpygui import dearpygui as dpg
 from PIL import Image
 
+from src.pipeline.modes import NATIVE_MODES, with_alpha
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
@@ -8,6 +9,9 @@ from src.utils.nodes import NodeParent
 class CropModule(NodeParent):
     name = "Crop"
     tooltip = "Crop image"
+    modes = NATIVE_MODES
+
+    geometric = True
 
     def __init__(self):
         super().__init__()
@@ -71,10 +75,21 @@ class CropModule(NodeParent):
         }
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        tag = tag.split("_")[-1]
-        left = self.settings["crop_" + tag]["left_" + tag]
-        top = self.settings["crop_" + tag]["top_" + tag]
-        right = self.settings["crop_" + tag]["right_" + tag]
-        bottom = self.settings["crop_" + tag]["bottom_" + tag]
-        return image.crop((left, top, right, bottom))
+    def scale(self, params, factor):
+        return {key: round(value * factor) for key, value in params.items()}
+
+    def output_size(self, params, size):
+        return params["right"] - params["left"], params["bottom"] - params["top"]
+
+    def identity(self, params, size):
+        return (params["left"], params["top"], params["right"], params["bottom"]) == (0, 0, *size)
+
+    def affine(self, params, size):
+        return (1, 0, params["left"], 0, 1, params["top"]), self.output_size(params, size)
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        box = params["left"], params["top"], params["right"], params["bottom"]
+        # Areas outside the image are left transparent
+        if box[0] < 0 or box[1] < 0 or box[2] > image.width or box[3] > image.height:
+            image = with_alpha(image)
+        return image.crop(box)
@@ -1,6 +1,7 @@
 from dearpygui import dearpygui as dpg
 from PIL import Image
 
+from src.pipeline.modes import NATIVE_MODES
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
@@ -8,6 +9,9 @@ from src.utils.nodes import NodeParent
 class FlipModule(NodeParent):
     name = "Flip"
     tooltip = "Flip image"
+    modes = NATIVE_MODES
+
+    geometric = True
 
     def __init__(self):
         super().__init__()
@@ -36,12 +40,19 @@ class FlipModule(NodeParent):
         self.settings[tag] = {"flip_mode_" + str(self.counter): "Horizontal"}
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        mode_tag = "flip_mode_" + tag.split("_")[-1]
-        if self.settings[tag][mode_tag] == "Horizontal":
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        if params["flip_mode"] == "Horizontal":
             return image.transpose(Image.FLIP_LEFT_RIGHT)
-        if self.settings[tag][mode_tag] == "Vertical":
+        if params["flip_mode"] == "Vertical":
             return image.transpose(Image.FLIP_TOP_BOTTOM)
 
-        image = image.transpose(Image.FLIP_LEFT_RIGHT)
-        return image.transpose(Image.FLIP_TOP_BOTTOM)
+        # Flipping both ways is a half turn, done in a single pass
+        return image.transpose(Image.ROTATE_180)
+
+    def affine(self, params, size):
+        width, height = size
+        if params["flip_mode"] == "Horizontal":
+            return (-1, 0, width, 0, 1, 0), size
+        if params["flip_mode"] == "Vertical":
+            return (1, 0, 0, 0, -1, height), size
+        return (-1, 0, width, 0, -1, height), size
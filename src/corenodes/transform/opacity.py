@@ -1,6 +1,8 @@
 from dearpygui import dearpygui as dpg
 from PIL import Image, ImageEnhance
 
+from src.pipeline.modes import NATIVE_MODES, with_alpha
+from src.pipeline.optimize import IDENTITY, blend_table
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
@@ -8,6 +10,10 @@ from src.utils.nodes import NodeParent
 class OpacityModule(NodeParent):
     name = "Opacity"
     tooltip = "Change image opacity"
+    modes = NATIVE_MODES
+
+    pointwise = True
+    alpha = True
 
     def __init__(self):
         super().__init__()
@@ -38,11 +44,20 @@ class OpacityModule(NodeParent):
         self.settings[tag] = {"opacity_percentage_" + str(self.counter): 100}
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        image = image.copy()
-        alpha = image.split()[3]
-        alpha = ImageEnhance.Brightness(alpha).enhance(
-            self.settings[tag]["opacity_percentage_" + tag.split("_")[-1]] / 100
-        )
+    def identity(self, params, size):
+        return params["opacity_percentage"] == 100
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        image = with_alpha(image).copy()
+        alpha = ImageEnhance.Brightness(image.getchannel("A")).enhance(params["opacity_percentage"] / 100)
         image.putalpha(alpha)
         return image
+
+    def footprint(self, params):
+        return 0
+
+    def lut(self, params: dict, bands: tuple, mean) -> list:
+        if "A" not in bands:
+            return None
+        table = blend_table(0, params["opacity_percentage"] / 100)
+        return [table if band == "A" else IDENTITY for band in bands]
@@ -1,13 +1,22 @@
 from dearpygui import dearpygui as dpg
 from PIL import Image
 
+from src.pipeline.modes import NATIVE_MODES
+from src.pipeline.optimize import resize
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
+# The filter and reducing gap of every quality. Reducing by a whole factor first makes large downscales
+# several times faster, and from a gap of 3 the result is within a few levels of a full Lanczos resize
+QUALITIES = {"Best": (Image.LANCZOS, None), "Balanced": (Image.LANCZOS, 3.0), "Fast": (Image.BILINEAR, 2.0)}
+
 
 class ResizeModule(NodeParent):
     name = "Resize"
     tooltip = "Resize image"
+    modes = NATIVE_MODES
+
+    geometric = True
 
     def __init__(self):
         super().__init__()
@@ -45,6 +54,14 @@ class ResizeModule(NodeParent):
                     default_value=input_image.height,
                     callback=self.update_output,
                 )
+                dpg.add_combo(
+                    tag="resize_quality_" + str(self.counter),
+                    label="Quality",
+                    items=list(QUALITIES),
+                    default_value="Balanced",
+                    width=100,
+                    callback=self.update_output,
+                )
 
             with dpg.node_attribute(attribute_type=dpg.mvNode_Attr_Output):
                 dpg.add_slider_int(
@@ -64,16 +81,34 @@ class ResizeModule(NodeParent):
             "width_size_" + str(self.counter): input_image.width,
             "height_size_" + str(self.counter): input_image.height,
             "resize_percentage_" + str(self.counter): 100,
+            "resize_quality_" + str(self.counter): "Balanced",
         }
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        tag = tag.split("_")[-1]
-        percent = self.settings["resize_" + tag]["resize_percentage_" + tag]
-        return image.resize(
-            (
-                max(self.settings["resize_" + tag]["width_size_" + tag] * percent // 100, 1),
-                max(self.settings["resize_" + tag]["height_size_" + tag] * percent // 100, 1),
-            ),
-            Image.LANCZOS,
+    def scale(self, params, factor):
+        return {
+            **params,
+            "width_size": max(round(params["width_size"] * factor), 1),
+            "height_size": max(round(params["height_size"] * factor), 1),
+        }
+
+    def output_size(self, params, size):
+        return (
+            max(params["width_size"] * params["resize_percentage"] // 100, 1),
+            max(params["height_size"] * params["resize_percentage"] // 100, 1),
         )
+
+    def identity(self, params, size):
+        return self.output_size(params, size) == size
+
+    def affine(self, params, size):
+        width, height = self.output_size(params, size)
+        return (size[0] / width, 0, 0, 0, size[1] / height, 0), (width, height)
+
+    def resampling(self, params):
+        # Projects saved before the option existed get the default
+        return QUALITIES[params.get("resize_quality", "Balanced")]
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        resample, reducing_gap = self.resampling(params)
+        return resize(image, self.output_size(params, image.size), resample, reducing_gap=reducing_gap)
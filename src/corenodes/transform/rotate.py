@@ -1,6 +1,9 @@
+import math
+
 from dearpygui import dearpygui as dpg
 from PIL import Image
 
+from src.pipeline.modes import NATIVE_MODES, with_alpha
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
@@ -8,6 +11,9 @@ from src.utils.nodes import NodeParent
 class RotateModule(NodeParent):
     name = "Rotate"
     tooltip = "Rotate image"
+    modes = NATIVE_MODES
+
+    geometric = True
 
     def __init__(self):
         super().__init__()
@@ -35,8 +41,29 @@ class RotateModule(NodeParent):
 
         tag = "rotate_" + str(self.counter)
         dpg.bind_item_theme(tag, theme.green)
-        self.settings[tag] = {"rotate_degrees_" + str(self.counter): 1}
+        self.settings[tag] = {"rotate_degrees_" + str(self.counter): 360}
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        return image.rotate(self.settings[tag]["rotate_degrees_" + tag.split("_")[1]])
+    def identity(self, params, size):
+        return params["rotate_degrees"] % 360 == 0
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        # Only half turns, and quarter turns of square images, cover the whole image and keep it opaque
+        degrees = params["rotate_degrees"] % 360
+        if degrees not in (0, 180) and not (degrees in (90, 270) and image.width == image.height):
+            image = with_alpha(image)
+        return image.rotate(params["rotate_degrees"])
+
+    def affine(self, params, size):
+        # The same matrix Image.rotate uses, turning around the center without expanding
+        angle = -math.radians(params["rotate_degrees"])
+        cos, sin = round(math.cos(angle), 15), round(math.sin(angle), 15)
+        center_x, center_y = size[0] / 2, size[1] / 2
+        return (
+            cos,
+            sin,
+            center_x - cos * center_x - sin * center_y,
+            -sin,
+            cos,
+            center_y + sin * center_x - cos * center_y,
+        ), size
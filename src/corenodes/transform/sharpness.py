@@ -1,6 +1,8 @@
 from dearpygui import dearpygui as dpg
 from PIL import Image, ImageEnhance
 
+from src.pipeline.cache import EnhancerCache
+from src.pipeline.modes import NATIVE_MODES
 from src.utils import find_available_pos, theme
 from src.utils.nodes import NodeParent
 
@@ -8,9 +10,11 @@ from src.utils.nodes import NodeParent
 class SharpnessModule(NodeParent):
     name = "Sharpness"
     tooltip = "Adjust sharpness"
+    modes = NATIVE_MODES
 
     def __init__(self):
         super().__init__()
+        self.enhancers = EnhancerCache(ImageEnhance.Sharpness)
 
     def new(self, history=True):
         with dpg.node(
@@ -38,7 +42,12 @@ class SharpnessModule(NodeParent):
         self.settings[tag] = {"sharpness_percentage_" + str(self.counter): 1}
         self.end(tag, history)
 
-    def run(self, image: Image.Image, tag: str) -> Image.Image:
-        tag = tag.split("_")[-1]
-        percent = self.settings["sharpness_" + tag]["sharpness_percentage_" + tag]
-        return ImageEnhance.Sharpness(image).enhance(percent / 25)
+    def footprint(self, params):
+        # ImageEnhance.Sharpness blends with a 3x3 smoothing filter
+        return 1
+
+    def identity(self, params, size):
+        return params["sharpness_percentage"] == 25
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        return self.enhancers.get(image).enhance(params["sharpness_percentage"] / 25)
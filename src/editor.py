@@ -1,28 +1,17 @@
-import importlib.metadata
-import importlib.util
 import json
 import os
 import sys
+from contextlib import suppress
 
 import dearpygui.dearpygui as dpg
-import yaml
-from packaging.version import parse as parse_version
 from PIL import Image
 
 from src.corenodes.display import InputModule, OutputModule
-from src.corenodes.transform import (
-    BlurModule,
-    BrightnessModule,
-    ContrastModule,
-    CropModule,
-    FlipModule,
-    OpacityModule,
-    ResizeModule,
-    RotateModule,
-    SharpnessModule,
-)
-from src.utils import fd, toaster
-from src.utils.nodes import HistoryItem, Link, history_manager, update
+from src.modules import load_plugins, transform_modules
+from src.pipeline import DiskCache, native, parse_size
+from src.utils import fd, node_registry, toaster
+from src.utils.links import Link
+from src.utils.nodes import HistoryItem, history_manager, update
 from src.utils.paths import resource
 
 
@@ -38,69 +27,21 @@ class NodeEditor:
     _project = None
 
     def __init__(self, pillow_image: Image.Image):
-        self.modules = [
-            InputModule(pillow_image),
-            ResizeModule(),
-            RotateModule(),
-            BlurModule(),
-            BrightnessModule(),
-            ContrastModule(),
-            SharpnessModule(),
-            OpacityModule(),
-            CropModule(),
-            FlipModule(),
-            OutputModule("output_0"),
-        ]
+        self.modules = [InputModule(pillow_image), *transform_modules(), OutputModule("output_0")]
 
         # Load all plugins from the plugins folder dynamically
-        for plugin in os.listdir("src/plugins"):
-            if not os.path.isdir("src/plugins/" + plugin):
-                continue
-            try:
-                with open("src/plugins/" + plugin + "/plugin.yaml") as file:
-                    info = yaml.safe_load(file)
-            except FileNotFoundError:
-                continue
-
-            if info.get("enabled", True) is False:
-                continue
-
-            # install any requirements that the plugin depends on
-            if info.get("requirements"):
-                for requirement in info.get("requirements", []):
-                    try:
-                        version = f"=={requirement['version']}"
-                    except KeyError:
-                        version = ""
-
-                    try:
-                        installed_version = parse_version(importlib.metadata.version(requirement["name"]))
-                        if installed_version != requirement.get("version", installed_version):
-                            print(
-                                f"Error when trying to load '{info['name']}': "
-                                f"{requirement['name']} is already installed with a different version."
-                            )
-                            sys.exit(1)
-                        else:
-                            print(f"Info: {requirement['name']} is already installed so skipping.")
-                    except importlib.metadata.PackageNotFoundError:
-                        os.system(f"pip install {requirement['name']}{version}")
-
-            file = info["runtime"]["main"]
-            if not file.endswith(".py"):
-                file += ".py"
-
-            spec = importlib.util.spec_from_file_location("plugin", "src/plugins/" + plugin + "/" + file)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            if "Node" in dir(module):
-                node = module.Node()
-                node.is_plugin = True
-                self.modules.insert(1, node)
+        for node in load_plugins():
+            self.modules.insert(1, node)
 
     def start(self):
+        # Set up here rather than with `update`, so importing the nodes doesn't scan the cache
+        cache = os.environ.get("CRESLIANT_CACHE")
+        if cache:
+            update.executor.disk = DiskCache(cache, parse_size(os.environ.get("CRESLIANT_CACHE_SIZE", "2G")))
+
         history_manager.update_path = update.update_path
         history_manager.update_output = update.update_output
+        history_manager.batch = update.batch
         history_manager.links = update.node_links
 
         with dpg.node_editor(
@@ -124,16 +65,14 @@ class NodeEditor:
                 dpg.add_text(module.tooltip)
 
     def link_callback(self, sender, app_data):
-        for link in update.node_links:
-            if link.source == app_data[0]:
-                try:
-                    dpg.delete_item(link.id)
-                except SystemError:
-                    continue
-                update.node_links.remove(link)
+        # An output can feed any number of nodes, but each input only takes one link
+        replaced = update.node_links.into(app_data[1])
+        if replaced:
+            with suppress(SystemError):
+                dpg.delete_item(replaced.id)
 
         link = dpg.add_node_link(app_data[0], app_data[1], parent=sender)
-        update.node_links.append(Link(source=app_data[0], target=app_data[1], id=int(link)))
+        update.node_links.add(Link(source=app_data[0], target=app_data[1], id=int(link)))
         history_manager.append(
             HistoryItem(
                 tag=str(link),
@@ -151,58 +90,62 @@ class NodeEditor:
 
     def delink_callback(self, _sender, app_data):
         dpg.delete_item(app_data)
-        for link in update.node_links:
-            if link.id == app_data:
-                history_manager.append(
-                    HistoryItem(
-                        tag=str(app_data),
-                        action="link_delete",
-                        data={
-                            "source": link.source,
-                            "target": link.target,
-                            "id": link.id,
-                        },
-                    )
+        link = update.node_links.remove(app_data)
+        if link:
+            history_manager.append(
+                HistoryItem(
+                    tag=str(app_data),
+                    action="link_delete",
+                    data={
+                        "source": link.source,
+                        "target": link.target,
+                        "id": link.id,
+                    },
                 )
-                update.node_links.remove(link)
-                break
+            )
 
         update.update_path()
         update.update_output()
 
     def delete_nodes(self, _sender, _app_data):
-        for node in dpg.get_selected_nodes(self._tag):
-            data = dpg.get_item_user_data(node)
-            if data.protected:
-                continue
+        with update.batch():
+            for node in dpg.get_selected_nodes(self._tag):
+                data = dpg.get_item_user_data(node)
+                if data.protected and dpg.get_item_alias(node) in ("Input", "Output"):
+                    continue
 
-            node_links = dpg.get_item_info(node)["children"][1]
-            history_manager.append(
-                HistoryItem(
-                    tag=dpg.get_item_alias(node),
-                    action="delete",
-                    data={
-                        "user_data": data,
-                        "settings": data.settings[dpg.get_item_alias(node)],
-                        "pos": dpg.get_item_pos(node),
-                        "links": node_links,
-                    },
+                node_links = dpg.get_item_info(node)["children"][1]
+                history_manager.append(
+                    HistoryItem(
+                        tag=dpg.get_item_alias(node),
+                        action="delete",
+                        data={
+                            "user_data": data,
+                            "settings": dict(data.settings[dpg.get_item_alias(node)]),
+                            "pos": dpg.get_item_pos(node),
+                            "links": node_links,
+                        },
+                    )
                 )
-            )
 
-            dpg.delete_item(node)
-            for link in update.node_links:
-                if link.source in node_links or link.target in node_links:
+                alias = dpg.get_item_alias(node)
+                node_registry.remove(alias)
+                update.frozen.discard(alias)
+                dpg.delete_item(node)
+                if data.name == "Output":
+                    data.release(alias)
+                for link in update.node_links.attached(node_links):
                     update.node_links.remove(link)
 
-        update.update_path()
-        update.update_output()
+            update.update_path()
+            update.update_output()
 
     def delete_links(self, _sender, _app_data):
-        for link in dpg.get_selected_links(self._tag):
-            dpg.delete_item(link)
-            for link_ in update.node_links:
-                if link_.id == link:
+        with update.batch():
+            for link in dpg.get_selected_links(self._tag):
+                dpg.delete_item(link)
+                link_ = update.node_links.remove(link)
+                if link_:
                     history_manager.append(
                         HistoryItem(
                             tag=str(link),
@@ -214,60 +157,71 @@ class NodeEditor:
                             },
                         )
                     )
-                    update.node_links.remove(link_)
-                    break
 
-        update.update_path()
-        update.update_output()
+            update.update_path()
+            update.update_output()
 
     def duplicate_nodes(self, _sender=None, _app_data=None):
+        with update.batch():
+            for node in dpg.get_selected_nodes(self._tag):
+                data_ = dpg.get_item_user_data(node)
+                if not data_.protected:
+                    data_.new()
+
+    def freeze_nodes(self, _sender=None, _app_data=None):
+        # Frozen nodes keep their output, so editing the nodes after them doesn't run them again
         for node in dpg.get_selected_nodes(self._tag):
-            data_ = dpg.get_item_user_data(node)
-            if not data_.protected:
-                data_.new()
+            if dpg.get_item_user_data(node).protected:
+                continue
+
+            tag = dpg.get_item_alias(node)
+            label = dpg.get_item_label(node)
+            if tag in update.frozen:
+                update.frozen.discard(tag)
+                dpg.configure_item(node, label=label.removesuffix(" (frozen)"))
+            else:
+                update.frozen.add(tag)
+                dpg.configure_item(node, label=label + " (frozen)")
+
+        update.update_path()
 
     def reset(self, _sender=None, _app_data=None):
-        for node in dpg.get_all_items():
-            try:
-                data_ = dpg.get_item_user_data(node)
-            except SystemError:
-                continue
-            try:
-                if data_ and not data_.protected:
+        with update.batch():
+            for node, data_ in node_registry.items():
+                if not data_.protected or data_.name == "Output":
                     dpg.delete_item(node)
-            except AttributeError:
-                continue
+                    node_registry.remove(node)
+                    if data_.name == "Output":
+                        data_.release(node)
 
-        update.node_links.clear()
-        history_manager.clear()
-        self._project = None
+            update.node_links.clear()
+            update.frozen.clear()
+            history_manager.clear()
+            self._project = None
 
-        self.modules[0].new()
-        self.modules[-1].new()
+            self.modules[0].new()
+            self.modules[-1].new()
 
-        update.update_path()
-        update.update_output()
+            update.update_path()
+            update.update_output()
 
     def save(self):
         data = {"nodes": {}, "links": [], "image": dpg.get_item_user_data("Input").image_path}
-        for node in dpg.get_all_items():
-            try:
-                data_ = dpg.get_item_user_data(node)
-            except SystemError:
-                continue
-            if data_:
-                data["nodes"][dpg.get_item_alias(node)] = {
-                    "pos": dpg.get_item_pos(node),
-                    "settings": data_.settings if hasattr(data_, "settings") else {},
-                }
+        for node, data_ in node_registry.items():
+            data["nodes"][node] = {
+                "pos": dpg.get_item_pos(node),
+                "settings": data_.settings if hasattr(data_, "settings") else {},
+            }
 
         for link in update.node_links:
-            source = dpg.get_item_user_data(dpg.get_item_info(link.source)["parent"])
-            target = dpg.get_item_user_data(dpg.get_item_info(link.target)["parent"])
+            source = dpg.get_item_info(link.source)["parent"]
+            target = dpg.get_item_info(link.target)["parent"]
             data["links"].append(
                 {
-                    "source": source.name,
-                    "target": target.name,
+                    "source": dpg.get_item_user_data(source).name,
+                    "target": dpg.get_item_user_data(target).name,
+                    "source_node": dpg.get_item_alias(source),
+                    "target_node": dpg.get_item_alias(target),
                 }
             )
 
@@ -315,67 +269,76 @@ class NodeEditor:
         except FileNotFoundError:
             return toaster.show("Open Project", "Invalid location specified.")
 
-        self.reset()
-        nodes = []
-        for node in data["nodes"]:
-            module = None
-            for module_ in self.modules:
-                if module_.name.lower() in node.lower():
-                    module = module_
-                    break
-
-            if not module:
-                continue
+        # Nodes, settings and links are all applied before a single render
+        with update.batch():
+            self.reset()
+            nodes = {}
+            for node in data["nodes"]:
+                module = None
+                for module_ in self.modules:
+                    if module_.name.lower() in node.lower():
+                        module = module_
+                        break
+
+                if not module:
+                    continue
 
-            module.new()
+                # The main Output was already recreated by the reset
+                if node != "Output":
+                    module.new()
 
-            if "_" in node:
-                tag = node.split("_", maxsplit=2)[0] + "_" + str(module.counter - 1)
-            else:
-                tag = node
+                if "_" in node:
+                    tag = node.split("_", maxsplit=2)[0] + "_" + str(module.counter - 1)
+                else:
+                    tag = node
 
-            nodes.append(tag)
-            dpg.set_item_pos(tag, data["nodes"][node]["pos"])
+                nodes[node] = tag
+                dpg.set_item_pos(tag, data["nodes"][node]["pos"])
 
-            for setting in data["nodes"][node]["settings"].get(node, {}):
-                setting_tag = "_".join(setting.split("_")[0:-1]) + "_" + str(module.counter - 1)
-                dpg.set_value(setting_tag, data["nodes"][node]["settings"][node][setting])
-                module.settings[tag][setting_tag] = data["nodes"][node]["settings"][node][setting]
+                for setting in data["nodes"][node]["settings"].get(node, {}):
+                    setting_tag = "_".join(setting.split("_")[0:-1]) + "_" + str(module.counter - 1)
+                    dpg.set_value(setting_tag, data["nodes"][node]["settings"][node][setting])
+                    module.settings[tag][setting_tag] = data["nodes"][node]["settings"][node][setting]
 
-        try:
-            image = Image.open(data["image"])
-            image = image.convert("RGBA")
-            self.modules[0].image = image.copy()
-            self.modules[0].image_path = data["image"]
-            image.thumbnail((450, 450), Image.LANCZOS)
-            self.modules[0].viewer.load(image)
-        except FileNotFoundError:
-            pass
-
-        for link in data["links"]:
-            source = None
-            target = None
-            for node in nodes:
-                check = node.split("_", maxsplit=2)[0].lower()
-                if check == link["source"].lower():
-                    source = dpg.get_item_info(node)["children"][1][-1]
-                elif check == link["target"].lower():
-                    target = dpg.get_item_info(node)["children"][1][0]
-
-            if not source or not target:
-                continue
+            try:
+                image = Image.open(data["image"])
+                image = native(image)
+                self.modules[0].image = image.copy()
+                self.modules[0].image_path = data["image"]
+                image.thumbnail((450, 450), Image.LANCZOS)
+                self.modules[0].viewer.load(image)
+            except FileNotFoundError:
+                pass
+
+            for link in data["links"]:
+                source = None
+                target = None
+                if link.get("source_node") in nodes and link.get("target_node") in nodes:
+                    source = dpg.get_item_info(nodes[link["source_node"]])["children"][1][-1]
+                    target = dpg.get_item_info(nodes[link["target_node"]])["children"][1][0]
+                else:
+                    # Older projects only stored the names of the linked nodes
+                    for node in nodes.values():
+                        check = node.split("_", maxsplit=2)[0].lower()
+                        if check == link["source"].lower():
+                            source = dpg.get_item_info(node)["children"][1][-1]
+                        elif check == link["target"].lower():
+                            target = dpg.get_item_info(node)["children"][1][0]
+
+                if not source or not target:
+                    continue
 
-            link = dpg.add_node_link(
-                source,
-                target,
-                parent=self._tag,
-            )
-            update.node_links.append(Link(source=source, target=target, id=int(link)))
+                link = dpg.add_node_link(
+                    source,
+                    target,
+                    parent=self._tag,
+                )
+                update.node_links.add(Link(source=source, target=target, id=int(link)))
 
-        self._project = location
-        update.update_path()
-        update.update_output()
-        toaster.show("Open Project", "Project opened successfully.")
+            self._project = location
+            update.update_path()
+            update.update_output()
+            toaster.show("Open Project", "Project opened successfully.")
 
 
 node_editor = NodeEditor(Image.open(resource("icon.ico")))
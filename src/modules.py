@@ -0,0 +1,107 @@
+import importlib.metadata
+import importlib.util
+import os
+import sys
+
+import yaml
+from packaging.version import parse as parse_version
+
+from src.corenodes.transform import (
+    BlurModule,
+    BrightnessModule,
+    ContrastModule,
+    CropModule,
+    FlipModule,
+    OpacityModule,
+    ResizeModule,
+    RotateModule,
+    SharpnessModule,
+)
+from src.utils.paths import general_path
+
+PLUGINS = general_path("src/plugins")
+
+
+# Stands in for the Input and Output nodes outside the editor, pipelines only go by their names
+class Terminal:
+    def __init__(self, name):
+        self.name = name
+
+
+def transform_modules():
+    return [
+        ResizeModule(),
+        RotateModule(),
+        BlurModule(),
+        BrightnessModule(),
+        ContrastModule(),
+        SharpnessModule(),
+        OpacityModule(),
+        CropModule(),
+        FlipModule(),
+    ]
+
+
+def load_plugins(install=True):
+    # The Node of every enabled plugin in the plugins folder. Missing requirements are installed,
+    # or without `install` the plugin is skipped, so headless runs never change the environment
+    nodes = []
+    for plugin in os.listdir(PLUGINS):
+        folder = os.path.join(PLUGINS, plugin)
+        if not os.path.isdir(folder):
+            continue
+        try:
+            with open(os.path.join(folder, "plugin.yaml")) as file:
+                info = yaml.safe_load(file)
+        except FileNotFoundError:
+            continue
+
+        if info.get("enabled", True) is False:
+            continue
+
+        # install any requirements that the plugin depends on
+        missing = False
+        for requirement in info.get("requirements") or []:
+            try:
+                version = f"=={requirement['version']}"
+            except KeyError:
+                version = ""
+
+            try:
+                installed_version = parse_version(importlib.metadata.version(requirement["name"]))
+                if installed_version != requirement.get("version", installed_version):
+                    print(
+                        f"Error when trying to load '{info['name']}': "
+                        f"{requirement['name']} is already installed with a different version."
+                    )
+                    if install:
+                        sys.exit(1)
+                    missing = True
+                elif install:
+                    print(f"Info: {requirement['name']} is already installed so skipping.")
+            except importlib.metadata.PackageNotFoundError:
+                if install:
+                    os.system(f"pip install {requirement['name']}{version}")
+                else:
+                    print(f"Warning: skipping '{info['name']}', {requirement['name']} isn't installed.")
+                    missing = True
+        if missing:
+            continue
+
+        file = info["runtime"]["main"]
+        if not file.endswith(".py"):
+            file += ".py"
+
+        spec = importlib.util.spec_from_file_location("plugin", os.path.join(folder, file))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if "Node" in dir(module):
+            node = module.Node()
+            node.is_plugin = True
+            nodes.append(node)
+    return nodes
+
+
+def headless_modules():
+    # The modules for rendering projects without the editor, in the same order as the editor has them
+    return [Terminal("Input"), *reversed(load_plugins(install=False)), *transform_modules(), Terminal("Output")]
@@ -0,0 +1,19 @@
+from .cache import EnhancerCache, RenderCache, clear_enhancers, keep_enhancers
+from .cancel import CancelToken, RenderCancelled, check_cancelled
+from .disk import DiskCache, canonical, content_hash, parse_size
+from .executor import Executor
+from .model import LinkSpec, NodeSpec, Pipeline, to_params
+from .modes import NATIVE_MODES, native, supported, with_alpha
+from .optimize import (
+    IDENTITY,
+    GeometricGroup,
+    PointwiseGroup,
+    blend_table,
+    compose,
+    fuse_geometric,
+    fuse_pointwise,
+    push_down,
+    resize,
+    skip_identities,
+)
+from .plan import Plan, Step
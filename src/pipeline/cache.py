@@ -0,0 +1,113 @@
+import contextvars
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from PIL import Image
+
+
+def image_size(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+def node_key(parent, tag, settings):
+    # A node's output only depends on what came before it and its own settings
+    return parent, tag, tuple(sorted(settings.items()))
+
+
+# Node outputs by key, least recently used ones are evicted past `max_bytes`
+class RenderCache:
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            image = self._items.get(key)
+            if image is not None:
+                self._items.move_to_end(key)
+            return image
+
+    def put(self, key, image: Image.Image):
+        with self._lock:
+            if key in self._items:
+                self.size -= image_size(self._items.pop(key))
+
+            size = image_size(image)
+            if size > self.max_bytes:
+                return
+
+            self._items[key] = image
+            self.size += size
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._items:
+            _, image = self._items.popitem(last=False)
+            self.size -= image_size(image)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+# Enhancers are only kept while a render that caches its nodes' inputs runs, other renders never see them again
+_keep_enhancers = contextvars.ContextVar("keep_enhancers", default=False)
+_enhancer_caches = weakref.WeakSet()
+
+
+@contextmanager
+def keep_enhancers(keep=True):
+    token = _keep_enhancers.set(keep)
+    try:
+        yield
+    finally:
+        _keep_enhancers.reset(token)
+
+
+def clear_enhancers():
+    # The kept enhancers hold their input and a degenerate image as large, so they go when the source changes
+    for cache in list(_enhancer_caches):
+        cache.clear()
+
+
+# The ImageEnhance enhancers of the last few inputs, so slider drags on the same input only blend
+class EnhancerCache:
+    def __init__(self, enhancer, max_items: int = 2):
+        self.enhancer = enhancer
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        _enhancer_caches.add(self)
+
+    def get(self, image: Image.Image):
+        if not _keep_enhancers.get():
+            return self.enhancer(image)
+
+        # Keyed by identity, the image is kept alive with its enhancer so the id can't be reused
+        with self._lock:
+            item = self._items.get(id(image))
+            if item is not None and item[0] is image:
+                self._items.move_to_end(id(image))
+                return item[1]
+
+        enhancer = self.enhancer(image)
+        with self._lock:
+            self._items[id(image)] = image, enhancer
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return enhancer
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,38 @@
+import threading
+
+_local = threading.local()
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+# Stops a render from another thread, check_cancelled() checks the token that's entered on this thread
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def __enter__(self):
+        _local.token = self
+        return self
+
+    def __exit__(self, *_):
+        _local.token = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def check(self):
+        if self._event.is_set():
+            raise RenderCancelled
+
+
+def check_cancelled():
+    # Nodes with long running loops can call this to stop early once their render is superseded
+    token = getattr(_local, "token", None)
+    if token is not None:
+        token.check()
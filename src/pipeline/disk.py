@@ -0,0 +1,104 @@
+import hashlib
+import mmap
+import os
+import tempfile
+from contextlib import suppress
+
+from PIL import Image
+
+
+def content_hash(image: Image.Image) -> str:
+    # Identifies the pixels of an image, whatever file or object they came from
+    digest = hashlib.blake2b(f"{image.mode} {image.width}x{image.height}".encode(), digest_size=16)
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(text) -> int:
+    # Sizes like "512M" or "2GiB", plain numbers are bytes
+    text = str(text).strip().upper().removesuffix("B").removesuffix("I")
+    factor = _UNITS.get(text[-1:], 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+
+def canonical(value):
+    # Params with the modules of fused nodes replaced by their names, so they're the same in every session
+    if isinstance(value, dict):
+        return tuple(sorted((key, canonical(item)) for key, item in value.items()))
+    if isinstance(value, list | tuple):
+        return tuple(canonical(item) for item in value)
+    if hasattr(value, "process"):
+        return value.name
+    return value
+
+
+# Rendered images as memory mapped raw pixel files, least recently used ones are deleted past `max_bytes`
+class DiskCache:
+    def __init__(self, directory, max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # A running total, other processes can write to the same directory so it's counted again when evicting
+        self.size = sum(size for _, size, _ in self._files())
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest())
+
+    def get(self, key) -> Image.Image | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                header = file.readline()
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            mode, width, height = header.decode().split()
+            pixels = memoryview(buffer)[len(header) :]
+            image = Image.frombuffer(mode, (int(width), int(height)), pixels, "raw", mode, 0, 1)
+            # The modification time is what eviction goes by
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return image
+
+    def put(self, key, image: Image.Image):
+        # Written to a temporary file first, so other processes never read half a file
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(f"{image.mode} {image.width} {image.height}\n".encode())
+                file.write(image.tobytes())
+                size = file.tell()
+            os.replace(temporary, self._path(key))
+        except OSError:
+            with suppress(OSError):
+                os.remove(temporary)
+            return
+
+        self.size += size
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _files(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def _evict(self):
+        # Goes down to three quarters of the limit, so the directory isn't scanned again on the next put
+        files = sorted(self._files())
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= self.max_bytes * 3 // 4:
+                break
+            with suppress(OSError):
+                os.remove(path)
+                self.size -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            with suppress(OSError):
+                os.remove(entry.path)
+        self.size = 0
@@ -0,0 +1,140 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+
+from PIL import Image
+
+from .cache import RenderCache, clear_enhancers, keep_enhancers
+from .disk import DiskCache, content_hash
+from .model import NodeSpec, Pipeline
+from .plan import Plan, Step
+
+
+# Runs a node graph on an image without DearPyGui, for the editor and batch renders alike
+class Executor:
+    def __init__(self, cache: RenderCache = None, workers: int = None, optimize: bool = True, disk: DiskCache = None):
+        self.cache = cache
+        self.disk = disk
+        self.optimize = optimize
+        self.workers = workers or os.cpu_count()
+        self._pool = None
+        self._source = None
+        self._source_hash = None
+        # The output of frozen steps by their tag and the size of the image the plan ran on, with its key
+        self._frozen = {}
+        self._proxy = None
+        self._proxy_size = None
+        self._lock = threading.Lock()
+
+    def run(
+        self, pipeline: Pipeline | Plan, source: Image.Image, preview_size=None, token=None
+    ) -> dict[str, Image.Image]:
+        # Returns the image of every connected Output by its tag, previews run on a proxy that fits `preview_size`
+        plan = pipeline if isinstance(pipeline, Plan) else Plan(pipeline)
+        image = self._prepare(source, preview_size)
+        chains = plan.steps(image.size, image.width / source.width, self.optimize)
+
+        # A single chain gains nothing from the thread pool
+        submit = self._submit if len(chains) > 1 else lambda *args: args[0](*args[1:])
+
+        frozen = {(step.tag, image.size): step for chain in chains.values() for step in chain if step.frozen}
+        with self._lock:
+            # Outputs of nodes that were unfrozen since aren't needed anymore, fused steps end at the frozen node
+            for key in list(self._frozen):
+                if key[0].rsplit("+", 1)[-1] not in plan.frozen:
+                    del self._frozen[key]
+
+        # Previews change with every slider step, only full size renders are worth keeping on disk
+        disk = self.disk if not preview_size else None
+        results = {}
+        outputs = {}
+        stored = set()
+        for output, chain in chains.items():
+            # Only run the steps after the last one whose output is still cached
+            start = 0
+            upstream = image
+            for idx in range(len(chain) - 1, -1, -1):
+                cached = self._cached(chain[idx], image.size)
+                if cached is not None:
+                    start = idx + 1
+                    upstream = cached
+                    break
+
+            if disk is not None and chain and start < len(chain):
+                key = self._source_hash, image.size, chain[-1].digest
+                cached = disk.get(key)
+                if cached is None:
+                    stored.add(output)
+                else:
+                    start = len(chain)
+                    upstream = cached
+                    if self.cache is not None:
+                        self.cache.put(chain[-1].key, cached)
+
+            for step in chain[start:]:
+                if step.tag not in results:
+                    results[step.tag] = submit(self._step, step, upstream, token)
+                upstream = results[step.tag]
+            outputs[output] = upstream
+
+        images = {tag: image.result() if isinstance(image, Future) else image for tag, image in outputs.items()}
+        for (tag, size), step in frozen.items():
+            if tag in results:
+                result = results[tag]
+                self._frozen[tag, size] = step.key, result.result() if isinstance(result, Future) else result
+        for output in stored:
+            disk.put((self._source_hash, image.size, chains[output][-1].digest), images[output])
+        return images
+
+    def _prepare(self, source, preview_size):
+        with self._lock:
+            if source is not self._source:
+                if self.cache is not None:
+                    self.cache.clear()
+                clear_enhancers()
+                self._source = source
+                self._source_hash = content_hash(source) if self.disk is not None else None
+                self._frozen.clear()
+                self._proxy = None
+
+            if not preview_size:
+                return source
+
+            if self._proxy is None or self._proxy_size != preview_size:
+                self._proxy = source.copy()
+                self._proxy.thumbnail(preview_size, Image.LANCZOS)
+                self._proxy_size = preview_size
+            return self._proxy
+
+    def _cached(self, step: Step, size):
+        if step.frozen:
+            key, image = self._frozen.get((step.tag, size), (None, None))
+            if key == step.key:
+                return image
+        return self.cache.get(step.key) if self.cache is not None else None
+
+    def _submit(self, *args):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="render")
+        # Nodes are submitted after the ones they depend on, so waiting on them can't deadlock the pool
+        return self._pool.submit(*args)
+
+    def _step(self, step: Step, upstream, token):
+        image = upstream.result() if isinstance(upstream, Future) else upstream
+        # Without a cache the inputs aren't run through again, so enhancers made for them aren't kept
+        with token or nullcontext(), keep_enhancers(self.cache is not None):
+            if token:
+                token.check()
+
+            image = step.run(image)
+
+        if self.cache is not None:
+            self.cache.put(step.key, image)
+        return image
+
+    @staticmethod
+    def output_size(nodes: list[NodeSpec], size):
+        for node in nodes:
+            size = node.module.output_size(node.params, size)
+        return size
@@ -0,0 +1,88 @@
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict
+
+
+def to_params(settings: dict) -> dict:
+    # Settings are keyed by their widget tags (e.g. "blur_percentage_3"), params drop the node counter
+    return {key.rsplit("_", 1)[0]: value for key, value in settings.items()}
+
+
+class NodeSpec(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    tag: str
+    module: Any
+    params: dict = {}
+    # The settings as a project stores them, for plugins that read them in run(image, tag)
+    settings: dict = {}
+
+    @property
+    def name(self) -> str:
+        return self.module.name
+
+
+class LinkSpec(BaseModel):
+    source: str
+    target: str
+
+
+# A node graph without widgets, nodes are identified by their tags and take a single input each
+class Pipeline(BaseModel):
+    nodes: dict[str, NodeSpec] = {}
+    links: list[LinkSpec] = []
+
+    def add_node(self, tag, module, params=None, settings=None) -> NodeSpec:
+        self.nodes[tag] = NodeSpec(tag=tag, module=module, params=params or {}, settings=settings or {})
+        return self.nodes[tag]
+
+    def add_link(self, source, target):
+        self.links.append(LinkSpec(source=source, target=target))
+
+    def outputs(self) -> list[str]:
+        return [tag for tag, node in self.nodes.items() if node.name == "Output"]
+
+    def chain(self, output="Output") -> list[NodeSpec] | None:
+        # The nodes between the Input and an Output, or None if they aren't connected
+        sources = {link.target: link.source for link in self.links}
+        chain = []
+        node = sources.get(output)
+        while node in self.nodes:
+            if self.nodes[node].name == "Input":
+                chain.reverse()
+                return chain
+            if len(chain) > len(self.nodes):
+                return None
+
+            chain.append(self.nodes[node])
+            node = sources.get(node)
+
+        return None
+
+    def chains(self) -> dict[str, list[NodeSpec]]:
+        # The chain of every Output that's connected to the Input
+        chains = {tag: self.chain(tag) for tag in self.outputs()}
+        return {tag: chain for tag, chain in chains.items() if chain is not None}
+
+    @classmethod
+    def load(cls, data: dict, modules: list) -> "Pipeline":
+        # Resolves nodes and links the same way NodeEditor.open_callback does
+        pipeline = cls()
+        names = {}
+        for node, info in data["nodes"].items():
+            module = next((module for module in modules if module.name.lower() in node.lower()), None)
+            if not module:
+                continue
+
+            settings = info["settings"].get(node, {})
+            pipeline.add_node(node, module, to_params(settings), settings)
+            names[node.split("_", maxsplit=2)[0].lower()] = node
+
+        for link in data["links"]:
+            # Older projects only stored the names of the linked nodes
+            source = link.get("source_node") or names.get(link["source"].lower())
+            target = link.get("target_node") or names.get(link["target"].lower())
+            if source in pipeline.nodes and target in pipeline.nodes:
+                pipeline.add_link(source, target)
+
+        return pipeline
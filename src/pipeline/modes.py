@@ -0,0 +1,31 @@
+from PIL import Image
+
+# The modes images go through the nodes in, everything else is converted to the closest one when loaded
+NATIVE_MODES = ("L", "LA", "RGB", "RGBA")
+
+
+def native(image: Image.Image) -> Image.Image:
+    # The smallest native mode that holds the image, alpha is dropped if every pixel is opaque
+    if image.mode not in NATIVE_MODES:
+        alpha = "A" in image.getbands() or "a" in image.getbands() or "transparency" in image.info
+        gray = image.getbands()[0] in ("1", "L", "I", "F")
+        image = image.convert(("LA" if alpha else "L") if gray else ("RGBA" if alpha else "RGB"))
+
+    if image.mode in ("LA", "RGBA") and image.getchannel("A").getextrema() == (255, 255):
+        image = image.convert(image.mode[:-1])
+    return image
+
+
+def with_alpha(image: Image.Image) -> Image.Image:
+    # For nodes that make pixels transparent, or leave areas without any pixels
+    if "A" in image.getbands():
+        return image
+    return image.convert("LA" if image.mode == "L" else "RGBA")
+
+
+def supported(image: Image.Image, modes) -> Image.Image:
+    # The image in one of the modes a node takes, keeping the alpha band if one of them has it
+    if image.mode in modes:
+        return image
+    alpha = [mode for mode in modes if "A" in mode]
+    return image.convert(alpha[0] if alpha and "A" in image.getbands() else modes[0])
@@ -0,0 +1,346 @@
+import math
+from functools import lru_cache
+from itertools import pairwise
+
+from PIL import Image, ImageChops, ImageStat
+
+from .model import NodeSpec
+from .modes import NATIVE_MODES, supported, with_alpha
+
+IDENTITY = list(range(256))
+_GRADIENT = Image.frombytes("L", (256, 1), bytes(IDENTITY))
+_BOX = ("left", "top", "right", "bottom")
+# The lossless transpose that swaps the axes, mirrors x and mirrors y of an image, by which of those it does
+_TRANSPOSES = {
+    (False, True, False): Image.FLIP_LEFT_RIGHT,
+    (False, False, True): Image.FLIP_TOP_BOTTOM,
+    (False, True, True): Image.ROTATE_180,
+    (True, False, False): Image.TRANSPOSE,
+    (True, True, False): Image.ROTATE_270,
+    (True, False, True): Image.ROTATE_90,
+    (True, True, True): Image.TRANSVERSE,
+}
+
+
+@lru_cache(maxsize=512)
+def blend_table(constant: int, factor: float) -> list[int]:
+    # Image.blend with a flat image as a table, which is what ImageEnhance does for brightness and contrast
+    return list(Image.blend(Image.new("L", (256, 1), constant), _GRADIENT, factor).getdata())
+
+
+def resize(image: Image.Image, size, resample=Image.LANCZOS, box=None, reducing_gap=None) -> Image.Image:
+    # Pillow drops `reducing_gap` when it premultiplies images with alpha, so that's done here instead
+    premultiplied = {"LA": "La", "RGBA": "RGBa"}.get(image.mode)
+    if premultiplied is None or resample == Image.NEAREST:
+        return image.resize(size, resample, box, reducing_gap)
+    return image.convert(premultiplied).resize(size, resample, box, reducing_gap).convert(image.mode)
+
+
+# Runs consecutive pointwise nodes, see NodeParent.lut, as a single Image.point pass
+class PointwiseGroup:
+    name = "Pointwise"
+    modes = NATIVE_MODES
+
+    def scale(self, params, factor):
+        return params
+
+    def output_size(self, params, size):
+        return size
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        nodes = [(module, dict(node_params)) for module, node_params in params["nodes"]]
+        if any(module.alpha for module, _ in nodes):
+            image = with_alpha(image)
+        for module, _ in nodes:
+            image = supported(image, module.modes)
+        tables = [IDENTITY] * len(image.getbands())
+        if image.mode in ("L", "LA", "RGB", "RGBA"):
+            for module, node_params in nodes:
+                lut = module.lut(node_params, image.getbands(), lambda tables=tables: self.mean(image, tables))
+                if lut is None:
+                    break
+                tables = [[lut[band][value] for value in table] for band, table in enumerate(tables)]
+            else:
+                return image.point([value for table in tables for value in table])
+
+        for module, node_params in nodes:
+            image = module.process(image, node_params)
+        return image
+
+    @staticmethod
+    def mean(image, tables):
+        # Matches ImageEnhance.Contrast as long as nothing has been applied yet, otherwise it's
+        # estimated from the histogram of the group's input, which is within a level of the real mean
+        if all(table is IDENTITY for table in tables):
+            return int(ImageStat.Stat(image.convert("L")).mean[0] + 0.5)
+
+        histogram = image.histogram()
+        means = [
+            sum(count * table[value] for value, count in enumerate(histogram[band * 256 : band * 256 + 256]))
+            / (image.width * image.height)
+            for band, table in enumerate(tables)
+        ]
+        if len(means) < 3:
+            return int(means[0] + 0.5)
+        return int(means[0] * 0.299 + means[1] * 0.587 + means[2] * 0.114 + 0.5)
+
+
+# Runs consecutive geometric nodes, see NodeParent.affine, as a single resampling pass
+class GeometricGroup:
+    name = "Geometric"
+    modes = NATIVE_MODES
+
+    def scale(self, params, factor):
+        return {
+            "nodes": tuple(
+                (module, tuple(sorted(module.scale(dict(node_params), factor).items())))
+                for module, node_params in params["nodes"]
+            )
+        }
+
+    def output_size(self, params, size):
+        for module, node_params in params["nodes"]:
+            size = module.output_size(dict(node_params), size)
+        return size
+
+    def process(self, image: Image.Image, params: dict) -> Image.Image:
+        matrix = (1, 0, 0, 0, 1, 0)
+        size = image.size
+        canvases = []
+        for module, node_params in params["nodes"]:
+            node_matrix, size = module.affine(dict(node_params), size)
+            node_matrix = _snap(node_matrix)
+            matrix = compose(matrix, node_matrix)
+            canvases.append((node_matrix, size))
+
+        return self.clip(self.resample(image, params, matrix, size), canvases)
+
+    @staticmethod
+    def clip(image, canvases):
+        # Every node only keeps what lands on its own canvas, so what an earlier node dropped is cut away again
+        mask = None
+        to_canvas = (1, 0, 0, 0, 1, 0)
+        for (node_matrix, _), (_, size) in zip(reversed(canvases[1:]), reversed(canvases[:-1]), strict=True):
+            to_canvas = compose(node_matrix, to_canvas)
+            if not _covers(to_canvas, size, image.size):
+                # Sampled the same way as the nodes themselves, so it matches where they leave pixels
+                canvas = Image.new("L", size, 255).transform(image.size, Image.AFFINE, to_canvas, Image.NEAREST)
+                mask = canvas if mask is None else ImageChops.multiply(mask, canvas)
+
+        if mask is None:
+            return image
+        image = with_alpha(image)
+        return Image.composite(image, Image.new(image.mode, image.size), mask)
+
+    @staticmethod
+    def resample(image, params, matrix, size):
+        a, b, c, d, e, f = matrix
+        # Right angle rotations only swap the axes, which is lossless like flips
+        swap = a == 0 and e == 0
+        if swap:
+            a, b, c, d, e, f = d, e, f, a, b, c
+        if b == 0 and d == 0:
+            # After a single transpose for the swap and flips, only a crop or a resize of part of the image is left
+            width, height = (image.height, image.width) if swap else image.size
+            flips = a < 0, e < 0
+            if flips[0]:
+                a, c = -a, width - c
+            if flips[1]:
+                e, f = -e, height - f
+            if (swap, *flips) in _TRANSPOSES:
+                image = image.transpose(_TRANSPOSES[swap, *flips])
+
+            box = (c, f, c + a * size[0], f + e * size[1])
+            inside = box[0] >= 0 and box[1] >= 0 and box[2] <= image.width and box[3] <= image.height
+            if a == 1 and e == 1 and all(float(value).is_integer() for value in box):
+                # Areas outside the image are left transparent
+                return (image if inside else with_alpha(image)).crop(tuple(int(value) for value in box))
+            if inside:
+                # The last Resize sets the size of the output, so its quality is used
+                resample, reducing_gap = Image.LANCZOS, None
+                for module, node_params in params["nodes"]:
+                    if module.name == "Resize":
+                        resample, reducing_gap = module.resampling(dict(node_params))
+                return resize(image, size, resample, box, reducing_gap)
+            matrix = (a, 0, c, 0, e, f)
+
+        # Image.transform doesn't filter when shrinking, so reduce large downscales first. Each axis by how far
+        # one output pixel moves along it, a rotation with a one-axis downscale keeps the detail of the other
+        reduction = max(int(math.hypot(a, b)), 1), max(int(math.hypot(d, e)), 1)
+        if reduction != (1, 1):
+            image = image.reduce(reduction)
+            matrix = (
+                a / reduction[0],
+                b / reduction[0],
+                c / reduction[0],
+                d / reduction[1],
+                e / reduction[1],
+                f / reduction[1],
+            )
+
+        resample = Image.BICUBIC if any(module.name == "Resize" for module, _ in params["nodes"]) else Image.NEAREST
+        return with_alpha(image).transform(size, Image.AFFINE, matrix, resample)
+
+
+def _snap(matrix):
+    # Right angle turns of images with an odd difference between width and height sample right between pixels,
+    # where the nearest neighbour is the next pixel. That's the same as moving them half a pixel, which has to
+    # happen for every node, otherwise only the rounding of the last one is left once they're fused
+    a, b, c, d, e, f = matrix
+    if not {a, b, d, e} <= {0, 1, -1}:
+        return matrix
+    return a, b, c + 0.5 if c % 1 == 0.5 else c, d, e, f + 0.5 if f % 1 == 0.5 else f
+
+
+def _covers(matrix, size, output_size):
+    # Whether every output pixel maps onto a canvas of `size`, the corners are enough for an affine matrix
+    a, b, c, d, e, f = matrix
+    for x in (0.5, output_size[0] - 0.5):
+        for y in (0.5, output_size[1] - 0.5):
+            if not (0 <= a * x + b * y + c < size[0] and 0 <= d * x + e * y + f < size[1]):
+                return False
+    return True
+
+
+def compose(first, second):
+    # The matrix that applies `second` and then `first`, as Image.transform takes them
+    a, b, c, d, e, f = first
+    g, h, i, j, k, m = second
+    return (
+        a * g + b * j,
+        a * h + b * k,
+        a * i + b * m + c,
+        d * g + e * j,
+        d * h + e * k,
+        d * i + e * m + f,
+    )
+
+
+_pointwise = PointwiseGroup()
+_geometric = GeometricGroup()
+
+
+def fuse_pointwise(chains: dict[str, list[NodeSpec]], keep=()) -> dict[str, list[NodeSpec]]:
+    # Runs end at nodes used by several nodes and at the nodes in `keep`
+    return _fuse(chains, "pointwise", _pointwise, keep)
+
+
+def fuse_geometric(chains: dict[str, list[NodeSpec]], keep=()) -> dict[str, list[NodeSpec]]:
+    # Runs end like the ones of fuse_pointwise
+    return _fuse(chains, "geometric", _geometric, keep)
+
+
+def skip_identities(chains: dict[str, list[NodeSpec]], size, keep=()) -> dict[str, list[NodeSpec]]:
+    # Drops nodes whose params leave the image as it is, see NodeParent.identity
+    skipped = {}
+    for output, chain in chains.items():
+        skipped[output] = []
+        node_size = size
+        for node in chain:
+            if node.tag in keep or not node.module.identity(node.params, node_size):
+                skipped[output].append(node)
+            node_size = node.module.output_size(node.params, node_size)
+    return skipped
+
+
+def push_down(chains: dict[str, list[NodeSpec]], size, keep=()) -> dict[str, list[NodeSpec]]:
+    # Moves crops past nodes with a footprint, padded by it, and downscales past nodes with a footprint of 0
+    consumers = _consumers(chains, keep)
+    return {output: _push_down(chain, size, consumers, keep) for output, chain in chains.items()}
+
+
+def _push_down(chain, size, consumers, keep):
+    nodes = list(chain)
+    idx = 0
+    while idx < len(nodes):
+        sizes = [size]
+        for node in nodes:
+            sizes.append(node.module.output_size(node.params, sizes[-1]))
+
+        node = nodes[idx]
+        width, height = node.module.output_size(node.params, sizes[idx])
+        downscale = node.name == "Resize" and width * height < sizes[idx][0] * sizes[idx][1]
+        if (node.name != "Crop" and not downscale) or node.tag in keep:
+            idx += 1
+            continue
+
+        # The nodes moved past must keep their size and only feed the next node
+        start = idx
+        pad = 0
+        while start > 0 and len(consumers.get(nodes[start - 1].tag, ())) <= 1:
+            footprint = nodes[start - 1].module.footprint(nodes[start - 1].params)
+            if footprint is None or (downscale and footprint):
+                break
+            pad += footprint
+            start -= 1
+
+        moved = [node] if downscale else _padded_crop(node, pad, sizes[start])
+        if start == idx or not moved:
+            idx += 1
+            continue
+
+        nodes = nodes[:start] + moved[:1] + nodes[start:idx] + moved[1:] + nodes[idx + 1 :]
+        idx += len(moved)
+
+    return nodes
+
+
+def _padded_crop(node, pad, size):
+    left, top, right, bottom = (node.params[key] for key in _BOX)
+    # Clamped to the image, so the nodes moved past see its real edges and never the fill around it
+    box = max(left - pad, 0), max(top - pad, 0), min(right + pad, size[0]), min(bottom + pad, size[1])
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return []
+
+    moved = [NodeSpec(tag=node.tag, module=node.module, params=dict(zip(_BOX, box, strict=True)))]
+    inner = left - box[0], top - box[1], right - box[0], bottom - box[1]
+    if inner != (0, 0, box[2] - box[0], box[3] - box[1]):
+        moved.append(NodeSpec(tag=node.tag + "_inner", module=node.module, params=dict(zip(_BOX, inner, strict=True))))
+    return moved
+
+
+def _consumers(chains, keep=()):
+    consumers = {}
+    for output, chain in chains.items():
+        tags = [node.tag for node in chain] + [output]
+        for tag, after in pairwise(tags):
+            consumers.setdefault(tag, set()).add(after)
+    # Kept nodes count as shared, so their output is never fused into or moved past
+    for tag in keep:
+        consumers.setdefault(tag, set()).add(None)
+    return consumers
+
+
+def _fuse(chains, kind, group, keep):
+    consumers = _consumers(chains, keep)
+    fused = {}
+    for output, chain in chains.items():
+        fused[output] = []
+        run = []
+        for node in chain:
+            if not getattr(node.module, kind, False):
+                fused[output].extend(_group(run, group))
+                fused[output].append(node)
+                run = []
+                continue
+
+            run.append(node)
+            if len(consumers[node.tag]) > 1:
+                fused[output].extend(_group(run, group))
+                run = []
+        fused[output].extend(_group(run, group))
+
+    return fused
+
+
+def _group(run: list[NodeSpec], group) -> list[NodeSpec]:
+    if len(run) < 2:
+        return run
+
+    return [
+        NodeSpec(
+            tag="+".join(node.tag for node in run),
+            module=group,
+            params={"nodes": tuple((node.module, tuple(sorted(node.params.items()))) for node in run)},
+        )
+    ]
@@ -0,0 +1,112 @@
+import copy
+import hashlib
+import threading
+
+from .cache import node_key
+from .disk import canonical
+from .model import NodeSpec, Pipeline
+from .modes import supported
+from .optimize import fuse_geometric, fuse_pointwise, push_down, skip_identities
+
+
+# A node bound to its params, `key` caches its output in memory and `digest` on disk
+class Step:
+    __slots__ = ("tag", "key", "digest", "module", "params", "frozen", "settings")
+
+    def __init__(self, tag, key, digest, module, params, frozen=False, settings=None):
+        self.tag = tag
+        self.key = key
+        self.digest = digest
+        self.module = module
+        self.params = params
+        self.frozen = frozen
+        self.settings = settings
+
+    def run(self, image):
+        image = supported(image, self.module.modes)
+        # Nodes that only implement the older run(image, tag) read their own settings, which aren't scaled
+        if getattr(self.module, "legacy", False):
+            # Outside the editor no widgets fill them in, so the ones the project was loaded with are used
+            if self.settings:
+                self.module.settings[self.tag] = self.settings
+            return self.module.run(image, self.tag)
+        return self.module.process(image, self.params)
+
+
+# A Pipeline compiled once per graph, with steps built once per image size until params change
+class Plan:
+    def __init__(self, pipeline: Pipeline, frozen=()):
+        self.nodes = dict(pipeline.nodes)
+        self.frozen = frozenset(frozen)
+        self.chains = {output: [node.tag for node in chain] for output, chain in pipeline.chains().items()}
+        self.active = {tag for chain in self.chains.values() for tag in chain}
+        self.fingerprint = self._fingerprint()
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def update(self, tag, params) -> "Plan":
+        # Returns a copy with new params for one node, plans are never changed while a render may use them
+        if tag not in self.nodes:
+            return self
+
+        plan = copy.copy(self)
+        plan.nodes = {**self.nodes, tag: NodeSpec(tag=tag, module=self.nodes[tag].module, params=params)}
+        plan.fingerprint = plan._fingerprint()
+        plan._steps = {}
+        plan._lock = threading.Lock()
+        return plan
+
+    def _fingerprint(self):
+        # Identifies what the plan renders, the params of the nodes on the path to every connected Output
+        outputs = []
+        for output, tags in sorted(self.chains.items()):
+            key = "Input"
+            for tag in tags:
+                key = node_key(key, tag, self.nodes[tag].params)
+            outputs.append((output, key))
+        return tuple(outputs)
+
+    def steps(self, size, factor=1, optimize=True) -> dict[str, list[Step]]:
+        # Pixel based params are scaled by `factor` for previews
+        with self._lock:
+            if (size, factor, optimize) not in self._steps:
+                # Batch renders go through many image sizes, only the recent ones are worth keeping
+                if len(self._steps) >= 8:
+                    self._steps.clear()
+                self._steps[size, factor, optimize] = self._compile(size, factor, optimize)
+            return self._steps[size, factor, optimize]
+
+    def _compile(self, size, factor, optimize):
+        chains = {output: [self.nodes[tag] for tag in tags] for output, tags in self.chains.items()}
+        if factor != 1:
+            # Scaled up front, so the optimizations below work with the sizes that are rendered
+            chains = {
+                output: [
+                    NodeSpec(tag=node.tag, module=node.module, params=node.module.scale(node.params, factor))
+                    for node in chain
+                ]
+                for output, chain in chains.items()
+            }
+        if optimize:
+            chains = skip_identities(chains, size, self.frozen)
+            chains = fuse_geometric(fuse_pointwise(push_down(chains, size, self.frozen), self.frozen), self.frozen)
+
+        steps = {}
+        for output, chain in chains.items():
+            key = ("Input", size)
+            digest = "Input"
+            steps[output] = []
+            for node in chain:
+                key = node_key(key, node.tag, node.params)
+                digest = hashlib.blake2b(f"{digest} {node.name} {canonical(node.params)!r}".encode(), digest_size=16)
+                digest = digest.hexdigest()
+                # A fused run ends at a frozen node, so its output is the frozen node's
+                frozen = node.tag.rsplit("+", 1)[-1] in self.frozen
+                settings = self.nodes[node.tag].settings if node.tag in self.nodes else None
+                steps[output].append(Step(node.tag, key, digest, node.module, node.params, frozen, settings))
+        return steps
+
+    def output_size(self, output, size):
+        for tag in self.chains[output]:
+            size = self.nodes[tag].module.output_size(self.nodes[tag].params, size)
+        return size
@@ -60,11 +60,15 @@ class Node(NodeParent):
         # This is a boilerplate function that should be called at the end to make it work with the history
         self.end(tag, history)
 
-    def run(self, image: Image, tag: str) -> Image:
+    def process(self, image: Image, params: dict) -> Image:
         # This is the function that is called when the node is run
         # Anything can be done here, you take in a PIL image and return a PIL image with the changes
-        intensity = self.settings[tag][self.name + "_intensity_" + tag.split("_")[-1]]
-        if self.settings[tag][self.name + "_mode_" + tag.split("_")[-1]] == "Party":
+        # `params` holds your settings without the node counter at the end of their names
+        # The image is RGBA, set `modes = NATIVE_MODES` from src.pipeline on the class to also take L, LA and RGB
+        # If you loop over the image yourself, call `check_cancelled()` from src.pipeline every so often
+        # so that renders the user has already moved on from can stop early
+        intensity = params[self.name + "_intensity"]
+        if params[self.name + "_mode"] == "Party":
             return image.point(lambda i: i + random.randint(0, intensity))
 
         filtered = image.filter(ImageFilter.GaussianBlur(radius=intensity / 65))
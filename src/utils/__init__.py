@@ -1,4 +1,4 @@
-from .nodes import find_available_pos, history_manager, theme
+from .nodes import find_available_pos, history_manager, node_registry, theme
 from .paths import resource
 from .view import AlignmentType, auto_align, toaster
 from .FileDialog import fd
@@ -0,0 +1,75 @@
+# A link from the output attribute `source` of a node to the input attribute `target` of another
+class Link:
+    __slots__ = ("source", "target", "id")
+
+    def __init__(self, source: int, target: int, id: int):
+        self.source = source
+        self.target = target
+        self.id = id
+
+    def __repr__(self):
+        return f"Link(source={self.source}, target={self.target}, id={self.id})"
+
+
+# The links of the editor by id and by the attributes they connect, an input only takes one link
+class LinkGraph:
+    def __init__(self):
+        self._links = {}
+        self._targets = {}
+        self._sources = {}
+
+    def add(self, link: Link) -> Link:
+        # Replaces the link that went into the same input, if there was one
+        self.remove(self._targets.get(link.target))
+        self._links[link.id] = link
+        self._targets[link.target] = link
+        self._sources.setdefault(link.source, {})[link.id] = link
+        return link
+
+    def remove(self, link: Link | int | None) -> Link | None:
+        link = self._links.pop(link if isinstance(link, int) else getattr(link, "id", None), None)
+        if link is None:
+            return None
+
+        del self._targets[link.target]
+        del self._sources[link.source][link.id]
+        if not self._sources[link.source]:
+            del self._sources[link.source]
+        return link
+
+    def get(self, id: int) -> Link | None:
+        return self._links.get(id)
+
+    def into(self, target: int) -> Link | None:
+        return self._targets.get(target)
+
+    def out_of(self, source: int) -> list[Link]:
+        return list(self._sources.get(source, {}).values())
+
+    def find(self, source: int, target: int) -> Link | None:
+        link = self._targets.get(target)
+        return link if link is not None and link.source == source else None
+
+    def attached(self, attributes) -> list[Link]:
+        # The links going into or out of any of the attributes, e.g. the ones of a node
+        links = {}
+        for attribute in attributes:
+            if attribute in self._targets:
+                links[self._targets[attribute].id] = self._targets[attribute]
+            links.update(self._sources.get(attribute, {}))
+        return list(links.values())
+
+    def clear(self):
+        self._links.clear()
+        self._targets.clear()
+        self._sources.clear()
+
+    def __iter__(self):
+        # Iterates over a copy, so links can be removed along the way
+        return iter(list(self._links.values()))
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, id):
+        return id in self._links
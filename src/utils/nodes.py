@@ -1,9 +1,15 @@
-from contextlib import suppress
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager, suppress
 
 import dearpygui.dearpygui as dpg
 import numpy as np
 from PIL import Image
-from pydantic import BaseModel
+
+from src.pipeline import Executor, Pipeline, Plan, RenderCache, to_params
+from src.utils.links import Link, LinkGraph
+from src.utils.worker import RenderWorker
 
 
 def find_available_pos():
@@ -11,12 +17,6 @@ def find_available_pos():
     return [max(0, x - 70), max(0, y - 70)]
 
 
-class Link(BaseModel):
-    source: int
-    target: int
-    id: int
-
-
 class NodeParent:
     def __init__(self):
         self.counter = 0
@@ -25,8 +25,61 @@ class NodeParent:
         self.protected = False
         self.is_plugin = False
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Plugins written before process() existed override run(image, tag) instead, they're still run through it
+        cls.legacy = cls.run is not NodeParent.run and cls.process is NodeParent.process
+
+    # The image modes process() takes, others are converted first. Nodes written before images kept their own mode
+    # only handle RGBA, the core nodes take all of NATIVE_MODES
+    modes = ("RGBA",)
+
+    # Nodes that map every pixel value on its own can set this and implement lut(),
+    # consecutive ones are then applied together as a single lookup table
+    pointwise = False
+
+    def lut(self, params, bands, mean):
+        # Return a table of 256 values for every band, or None if the image can't be handled with one
+        return None
+
+    # Nodes that change the alpha of pixels set this, images without an alpha band get one before them
+    alpha = False
+
+    # Nodes that only move pixels around can set this and implement affine(),
+    # consecutive ones are then resampled together in a single transform
+    geometric = False
+
+    def affine(self, params, size):
+        # Return the matrix mapping output coordinates to input ones, as Image.transform takes it, and the output size
+        return None
+
+    def footprint(self, params):
+        # Override with how many pixels around each pixel the node reads, if it keeps the size and reads no more,
+        # so crops can be moved before it. Pointwise nodes that don't look at the whole image return 0
+        return None
+
+    def identity(self, params, size):
+        # Override to return True for params that leave an image of `size` as it is, the node is then skipped
+        return False
+
+    def process(self, image, params):
+        # Override with the node's operation, params are its settings without the node counter in the keys
+        raise NotImplementedError
+
+    def scale(self, params, factor):
+        # Override for params measured in pixels so previews on a smaller proxy image match the export
+        return params
+
+    def output_size(self, params, size):
+        # Override if the node changes the size of the image
+        return size
+
+    def run(self, image, tag, settings=None):
+        return self.process(image, to_params(settings or self.settings[tag]))
+
     def end(self, tag, history):
         # Do global boilerplate across all nodes
+        node_registry.add(tag, self)
         if history:
             history_manager.append(
                 HistoryItem(
@@ -42,37 +95,86 @@ class NodeParent:
         self.counter += 1
 
 
+# The nodes in the editor by tag, so finding them doesn't mean going through every item of the app
+class NodeRegistry:
+    def __init__(self):
+        self._nodes = {}
+
+    def add(self, tag, module):
+        self._nodes[tag] = module
+
+    def remove(self, tag):
+        self._nodes.pop(tag, None)
+
+    def items(self):
+        # Drops nodes that were deleted some other way, e.g. along with the node editor
+        for tag in [tag for tag in self._nodes if not dpg.does_item_exist(tag)]:
+            del self._nodes[tag]
+        return list(self._nodes.items())
+
+    def __contains__(self, tag):
+        return tag in self._nodes
+
+
 class Update:
     def __init__(self):
-        self.path = []
-        self.node_links = []
+        self.plan = Plan(Pipeline())
+        self.node_links = LinkGraph()
+        # Tags of the nodes whose output is kept while the nodes after them are edited
+        self.frozen = set()
+        self.executor = Executor(RenderCache())
+        # Previews of recent states by plan fingerprint and Output, so undo and redo can show them right away
+        self.previews = RenderCache(64 * 1024 * 1024)
+        self._previews_source = None
+        self.preview_size = (450, 450)
+        self.worker = RenderWorker()
+        # The Input image and plan fingerprint of the last render
+        self._rendered = None
+        self._batch = 0
+        self._batches = 0
+        self._deferred = set()
+
+    @contextmanager
+    def batch(self):
+        # Runs update_path and update_output once when the outermost batch ends, its history undoes as one step
+        if not self._batch:
+            self._batches += 1
+            history_manager.group = self._batches
+        self._batch += 1
+        try:
+            yield
+        finally:
+            self._batch -= 1
+            if not self._batch:
+                history_manager.group = None
+                deferred, self._deferred = self._deferred, set()
+                if "path" in deferred:
+                    self.update_path()
+                if "output" in deferred:
+                    self.update_output()
 
     def update_path(self):
-        self.path.clear()
-        for node in dpg.get_all_items():
+        # Mirrors the linked nodes of the editor into a Pipeline and compiles it, this is the only place
+        # renders look at the widgets, until the graph changes again only edited params are updated
+        if self._batch:
+            self._deferred.add("path")
+            return
+
+        pipeline = Pipeline()
+        for link in self.node_links:
             try:
-                data_ = dpg.get_item_user_data(node)
+                source = dpg.get_item_info(link.source)["parent"]
+                target = dpg.get_item_info(link.target)["parent"]
             except SystemError:
                 continue
-            if data_ and data_.name == "Input":
-                self.path.append(node)
-                break
-
-        while True:
-            link = dpg.get_item_info(self.path[-1])["children"][1][-1]
-            found = False
-            for link_ in self.node_links:
-                if link_.source == link:
-                    try:
-                        self.path.append(dpg.get_item_info(link_.target)["parent"])
-                    except SystemError:
-                        continue
-
-                    found = True
-                    break
-
-            if not found:
-                break
+
+            for node in (source, target):
+                tag = dpg.get_item_alias(node)
+                if tag not in pipeline.nodes:
+                    module = dpg.get_item_user_data(node)
+                    pipeline.add_node(tag, module, to_params(module.settings.get(tag, {})))
+            pipeline.add_link(dpg.get_item_alias(source), dpg.get_item_alias(target))
+        self.plan = Plan(pipeline, self.frozen)
 
     def update_output(self, sender=None, app_data=None, history=True):
         if sender and app_data:
@@ -92,72 +194,230 @@ class Update:
                     )
                 )
             module.settings[alias][sender] = app_data
-        try:
-            output = dpg.get_item_user_data(self.path[-1])
-        except IndexError:
-            dpg.delete_item("Output_attribute", children_only=True)
+            # Nodes off the path between the Input and an Output can't change what's shown
+            if alias not in self.plan.active:
+                return
+            self.plan = self.plan.update(alias, to_params(module.settings[alias]))
+
+        if self._batch:
+            self._deferred.add("output")
             return
-        if output.name != "Output":
-            dpg.delete_item("Output_attribute", children_only=True)
+
+        snapshot = self.snapshot()
+        if snapshot is None:
+            if self._rendered is not None:
+                self._rendered = None
+                self.worker.publish({})
             return
 
-        image = dpg.get_item_user_data("Input").image
-        img_size = image.size
-        for node in self.path[1:-1]:
-            tag = dpg.get_item_alias(node)
-            node = dpg.get_item_user_data(node)
-            image = node.run(image, tag)
-
-        dpg.delete_item(output.image)
-        with suppress(SystemError):
-            dpg.remove_alias(output.image)
-
-        counter = output.image.split("_")[-1]
-        output.image = "output_" + str(int(counter) + 1)
-        output.pillow_image = image.copy()
-        image.thumbnail((450, 450), Image.LANCZOS)
-        with dpg.texture_registry():
-            dpg.add_static_texture(
-                image.width,
-                image.height,
-                np.frombuffer(image.tobytes(), dtype=np.uint8) / 255.0,
-                tag=output.image,
-            )
-        dpg.delete_item("Output_attribute", children_only=True)
-        dpg.add_image(output.image, parent="Output_attribute")
-        if output.pillow_image.size != img_size:
-            dpg.add_spacer(height=5, parent="Output_attribute")
-            dpg.add_text(
-                f"Image size: {output.pillow_image.width}x{output.pillow_image.height}", parent="Output_attribute"
-            )
+        # Only render if the image or a node on the active path changed since the last render
+        if self._rendered and self._rendered[0] is snapshot[0] and self._rendered[1] == snapshot[1].fingerprint:
+            return
+        self._rendered = snapshot[0], snapshot[1].fingerprint
+        cached = self._cached_preview(snapshot)
+        if cached is not None:
+            self.worker.publish(cached)
+            return
 
+        self.worker.submit(lambda token: self._preview(snapshot, token))
 
-class HistoryItem(BaseModel):
-    tag: str
-    action: str
-    data: dict
+    def present(self):
+        # Swaps in the latest finished preview, textures are only touched from the main thread
+        result = self.worker.take()
+        if result is None:
+            return
+
+        output = dpg.get_item_user_data("Output")
+        # Nodes are added and deleted from the callback thread meanwhile
+        for tag in list(output.settings):
+            if not dpg.does_item_exist(tag):
+                continue
 
+            attribute = tag + "_attribute"
+            if tag not in result:
+                dpg.delete_item(attribute, children_only=True)
+                continue
 
+            image, size, source_size = result[tag]
+            # Textures are always RGBA, whatever mode the image was rendered in
+            image = image.convert("RGBA") if image.mode != "RGBA" else image.copy()
+            image.thumbnail(self.preview_size, Image.LANCZOS)
+
+            # The image widget is only rebuilt when the texture had to be reallocated
+            if self.upload(output, tag, image) or len(dpg.get_item_children(attribute, 1)) != 2:
+                dpg.delete_item(attribute, children_only=True)
+                dpg.add_image(output.textures[tag], parent=attribute)
+                with dpg.group(parent=attribute):
+                    dpg.add_spacer(height=5)
+                    dpg.add_text()
+
+            caption = dpg.get_item_children(attribute, 1)[1]
+            dpg.configure_item(caption, show=size != source_size)
+            dpg.set_value(dpg.get_item_children(caption, 1)[1], f"Image size: {size[0]}x{size[1]}")
+
+    @staticmethod
+    def upload(output, tag, image):
+        # Writes the image into the output's dynamic texture, returns True if it had to be reallocated
+        buffer = output.buffers.get(tag)
+        if buffer is not None and buffer.shape == (image.height, image.width, 4):
+            np.multiply(np.asarray(image), np.float32(1 / 255), out=buffer)
+            dpg.set_value(output.textures[tag], buffer)
+            return False
+
+        buffer = output.buffers[tag] = np.multiply(np.asarray(image), np.float32(1 / 255), dtype=np.float32)
+        with dpg.texture_registry():
+            texture = dpg.add_dynamic_texture(image.width, image.height, buffer)
+
+        if output.textures.get(tag):
+            dpg.delete_item(output.textures[tag])
+            with suppress(SystemError):
+                dpg.remove_alias(output.textures[tag])
+        output.textures[tag] = texture
+        if tag == "Output":
+            output.image = texture
+        return True
+
+    def snapshot(self):
+        # Plans are replaced rather than changed, so a render can keep using this one while the user edits
+        if not self.plan.chains:
+            return None
+        return dpg.get_item_user_data("Input").image, self.plan
+
+    def render(self, preview=False, snapshot=None, token=None):
+        # Returns the image of every connected Output by its tag
+        snapshot = snapshot or self.snapshot()
+        if snapshot is None:
+            return {}
+
+        source, plan = snapshot
+        return self.executor.run(plan, source, self.preview_size if preview else None, token)
+
+    def _cached_preview(self, snapshot):
+        source, plan = snapshot
+        if source is not self._previews_source:
+            self.previews.clear()
+            self._previews_source = source
+
+        images = {tag: self.previews.get((plan.fingerprint, tag)) for tag in plan.chains}
+        if None in images.values():
+            return None
+        return {tag: (image, plan.output_size(tag, source.size), source.size) for tag, image in images.items()}
+
+    def _preview(self, snapshot, token):
+        images = self.render(True, snapshot, token)
+        source, plan = snapshot
+        if source is self._previews_source:
+            for tag, image in images.items():
+                self.previews.put((plan.fingerprint, tag), image)
+        return {tag: (image, plan.output_size(tag, source.size), source.size) for tag, image in images.items()}
+
+
+# A single change to the editor, `data` only holds what's needed to undo and redo it
+class HistoryItem:
+    __slots__ = ("tag", "action", "data", "group", "time", "size")
+
+    def __init__(self, tag: str, action: str, data: dict, group: int = None):
+        self.tag = tag
+        self.action = action
+        self.data = data
+        self.group = group
+        self.time = time.monotonic()
+        self.size = _size(data)
+
+
+def _size(value):
+    # A rough estimate of the memory a history item keeps alive, shared objects like modules aren't counted
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size(key) + _size(item) for key, item in value.items())
+    if isinstance(value, list | tuple):
+        return sys.getsizeof(value) + sum(_size(item) for item in value)
+    if isinstance(value, str | int | float | bool | None):
+        return sys.getsizeof(value)
+    return 8
+
+
+# Bounded by item count and memory, updates to one widget within `merge_window` seconds are merged
 class HistoryManager:
-    def __init__(self):
-        self.history: list[HistoryItem] = []
+    def __init__(self, max_items=1000, max_bytes=4 * 1024 * 1024, merge_window=1.0):
+        self.history: deque[HistoryItem] = deque()
         self.index = -1
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.merge_window = merge_window
+        self.size = 0
         self.update_output = None
         self.update_path = None
+        self.batch = None
         self.links = None
+        # Items appended while this is set are undone and redone as one step
+        self.group = None
 
     def clear(self):
-        self.history = []
+        self.history.clear()
         self.index = -1
+        self.size = 0
 
     def append(self, item: HistoryItem):
-        if self.index != len(self.history) - 1:
-            self.history = self.history[: self.index + 1]
+        while len(self.history) > self.index + 1:
+            self.size -= self.history.pop().size
+
+        item.group = self.group
+        if self._merge(item):
+            return
 
         self.history.append(item)
         self.index += 1
+        self.size += item.size
+        while self.history and (len(self.history) > self.max_items or self.size > self.max_bytes):
+            self.size -= self.history.popleft().size
+            self.index -= 1
+
+    def _merge(self, item):
+        # Folds an update into the previous one if it's for the same widget, keeping the value from before both
+        if not self.history or item.action != "update":
+            return False
+
+        last = self.history[-1]
+        if (
+            last.action != "update"
+            or last.tag != item.tag
+            or last.data.keys() != item.data.keys()
+            or last.group != item.group
+            or item.time - last.time > self.merge_window
+        ):
+            return False
+
+        key = next(iter(item.data))
+        last.data[key] = (item.data[key][0], last.data[key][1])
+        last.time = item.time
+        return True
 
     def undo(self):
+        # Everything recorded in one batch of edits is undone together, with a single render at the end
+        with self.batch():
+            group = self.current.group if self.index >= 0 else None
+            while self._undo() and group is not None and self.index >= 0 and self.current.group == group:
+                pass
+
+    def redo(self):
+        with self.batch():
+            while (
+                self._redo()
+                and self.current.group is not None
+                and self.index < len(self.history) - 1
+                and self.history[self.index + 1].group == self.current.group
+            ):
+                pass
+
+    @staticmethod
+    def _delete_node(tag, module):
+        dpg.delete_item(tag)
+        node_registry.remove(tag)
+        if module.name == "Output":
+            module.release(tag)
+
+    def _undo(self):
+        # Returns False if the action couldn't be applied
         if self.index >= 0:
             item = self.current
             try:
@@ -167,15 +427,15 @@ class HistoryManager:
                             self.history[self.index].data["pos"] = dpg.get_item_pos(item.tag)
                         except SystemError:
                             self.index = len(self.history) - 1
-                            return
-                        dpg.delete_item(item.tag)
+                            return False
+                        self._delete_node(item.tag, item.data["user_data"])
                     case "update":
                         key, value = next(iter(item.data.items()))
                         try:
                             dpg.set_value(key, value[1])
                         except SystemError:
                             self.index = len(self.history) - 1
-                            return
+                            return False
                         self.update_output(key, value[1], False)
                     case "delete":
                         data = item.data["user_data"]
@@ -198,14 +458,12 @@ class HistoryManager:
                             parent="MainNodeEditor",
                         )
                         self.history[self.index].data["id"] = tag
-                        self.links.append(Link(source=item.data["source"], target=item.data["target"], id=tag))
+                        self.links.add(Link(source=item.data["source"], target=item.data["target"], id=tag))
                         self.update_path()
                         self.update_output()
                     case "link_create":
                         dpg.delete_item(item.data["id"])
-                        for link in self.links:
-                            if link.source == item.data["source"] and link.target == item.data["target"]:
-                                self.links.remove(link)
+                        self.links.remove(self.links.find(item.data["source"], item.data["target"]))
                         self.update_path()
                         self.update_output()
                     case _:
@@ -214,8 +472,10 @@ class HistoryManager:
                 print("Warning: Could not undo action:", item.action)
 
             self.index -= 1
+        return True
 
-    def redo(self):
+    def _redo(self):
+        # Returns False if the action couldn't be applied
         if self.index < len(self.history) - 1:
             self.index += 1
             item = self.current
@@ -229,7 +489,7 @@ class HistoryManager:
                         except SystemError:
                             data.counter += 1
                             self.index = len(self.history) - 1
-                            return
+                            return False
 
                         tag = "_".join(item.tag.split("_")[:-1]) + "_" + str(data.counter - 1)
                         dpg.set_item_pos(tag, item.data["pos"])
@@ -248,20 +508,18 @@ class HistoryManager:
                             dpg.set_value(key, value[0])
                         except SystemError:
                             self.index = len(self.history) - 1
-                            return
+                            return False
                         self.update_output(key, value[0], False)
                     case "delete":
                         try:
                             self.history[self.index].data["pos"] = dpg.get_item_pos(item.tag)
                         except SystemError:
                             self.index = len(self.history) - 1
-                            return
-                        dpg.delete_item(item.tag)
+                            return False
+                        self._delete_node(item.tag, item.data["user_data"])
                     case "link_delete":
                         dpg.delete_item(item.data["id"])
-                        for link in self.links:
-                            if link.source == item.data["source"] and link.target == item.data["target"]:
-                                self.links.remove(link)
+                        self.links.remove(self.links.find(item.data["source"], item.data["target"]))
                         self.update_path()
                         self.update_output()
                     case "link_create":
@@ -271,13 +529,14 @@ class HistoryManager:
                             parent="MainNodeEditor",
                         )
                         self.history[self.index].data["id"] = tag
-                        self.links.append(Link(source=item.data["source"], target=item.data["target"], id=tag))
+                        self.links.add(Link(source=item.data["source"], target=item.data["target"], id=tag))
                         self.update_path()
                         self.update_output()
                     case _:
                         raise ValueError(f"Unknown action in redo: {item.action}")
             except SystemError:
                 print("Warning: Could not redo action:", item.action)
+        return True
 
     @property
     def current(self):
@@ -331,4 +590,5 @@ class Theme:
 
 theme = Theme()
 history_manager = HistoryManager()
+node_registry = NodeRegistry()
 update = Update()
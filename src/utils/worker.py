@@ -0,0 +1,79 @@
+import threading
+import traceback
+
+from src.pipeline import CancelToken, RenderCancelled
+
+
+# Renders on a background thread, a new job replaces the pending one instead of queueing behind it
+class RenderWorker:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = None
+        self._running = False
+        self._generation = 0
+        self._result = None
+        self._token = None
+        self._thread = None
+
+    def start_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                job, self._pending = self._pending, None
+                generation = self._generation
+                self._running = True
+                token = self._token = CancelToken()
+
+            try:
+                result = job(token)
+            except RenderCancelled:
+                result = None
+            except Exception:
+                traceback.print_exc()
+                result = None
+
+            with self._condition:
+                self._running = False
+                self._token = None
+                if result is not None and generation == self._generation:
+                    self._result = result
+                self._condition.notify_all()
+
+    def submit(self, job):
+        # The job is called with a CancelToken that gets cancelled once a newer job is submitted
+        with self._condition:
+            self._cancel()
+            self._pending = job
+            self._condition.notify_all()
+        self.start_thread()
+
+    def clear(self):
+        # Drops the pending job and the result of the one that's running
+        self.publish(None)
+
+    def publish(self, result):
+        # Hands over a result that's already known, in place of the pending job and the one that's running
+        with self._condition:
+            self._cancel()
+            self._pending = None
+            self._result = result
+            self._generation += 1
+
+    def _cancel(self):
+        if self._token is not None:
+            self._token.cancel()
+
+    def take(self):
+        with self._condition:
+            result, self._result = self._result, None
+        return result
+
+    def wait(self, timeout=None):
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending is None and not self._running, timeout)
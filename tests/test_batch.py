@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+
+from PIL import Image
+
+from src.batch import find_images, main, output_paths
+
+
+def make_project(tmp_path):
+    project = tmp_path / "project.cresliant"
+    data = {
+        "nodes": {
+            "Input": {"settings": {}},
+            "flip_0": {"settings": {"flip_0": {"flip_mode_0": "Horizontal"}}},
+            "Output": {"settings": {}},
+        },
+        "links": [
+            {"source": "Input", "target": "Flip", "source_node": "Input", "target_node": "flip_0"},
+            {"source": "Flip", "target": "Output", "source_node": "flip_0", "target_node": "Output"},
+        ],
+    }
+    project.write_text(json.dumps(data))
+    return str(project)
+
+
+def make_image(path, color):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image = Image.new("RGB", (4, 2), color)
+    image.putpixel((0, 0), (0, 0, 0))
+    image.save(path)
+
+
+def test_find_images(tmp_path):
+    make_image(tmp_path / "in" / "a.png", "red")
+    make_image(tmp_path / "in" / "b.jpg", "red")
+    (tmp_path / "in" / "notes.txt").write_text("")
+    images = list(find_images([str(tmp_path / "in"), str(tmp_path / "in" / "*.png")]))
+    assert [path.rsplit("/", 1)[-1] for path in images] == ["a.png", "b.jpg"]
+
+
+def test_output_paths():
+    paths = output_paths("in/photo.jpg", "out", "{stem}_{index}", "png", 3, ["Output", "Output_1"])
+    assert paths == {"Output": "out/photo_3.png", "Output_1": "out/photo_3_output_1.png"}
+    assert output_paths("in/photo.jpg", "out", "{stem}", "", 0, ["Output"]) == {"Output": "out/photo.jpg"}
+
+
+def test_main(tmp_path, capsys):
+    project = make_project(tmp_path)
+    make_image(tmp_path / "x" / "p.png", "red")
+    make_image(tmp_path / "y" / "q.png", "blue")
+    out = tmp_path / "out"
+
+    assert main([project, str(tmp_path / "x"), str(tmp_path / "y"), "-o", str(out), "-j", "1"]) == 0
+    assert "Rendered 2 of 2 images." in capsys.readouterr().out
+    flipped = Image.open(out / "p.png")
+    assert flipped.getpixel((3, 0)) == (0, 0, 0)
+    assert flipped.getpixel((0, 0)) == (255, 0, 0)
+
+    # Inputs that would overwrite each other's results are refused before anything is rendered
+    make_image(tmp_path / "y" / "p.jpg", "blue")
+    assert main([project, str(tmp_path / "x"), str(tmp_path / "y"), "-o", str(tmp_path / "clash")]) == 1
+    assert "would both be written to" in capsys.readouterr().out
+    assert not (tmp_path / "clash").exists()
+    assert main([project, str(tmp_path / "x"), str(tmp_path / "y"), "-o", str(out), "-n", "{stem}_{ext}"]) == 0
+
+
+def test_headless_import(tmp_path):
+    # Batch runs work from any directory, without the editor or its threads
+    code = "import sys, threading, src.batch; assert 'src.editor' not in sys.modules and threading.active_count() == 1"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root, "CRESLIANT_CACHE": str(tmp_path / "cache")}
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, check=True)
+    assert not (tmp_path / "cache").exists()
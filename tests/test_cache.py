@@ -0,0 +1,111 @@
+import os
+
+from PIL import Image, ImageEnhance
+
+from src.corenodes.transform import BrightnessModule
+from src.pipeline import Executor, Pipeline
+from src.pipeline.cache import EnhancerCache, RenderCache, clear_enhancers, image_size, keep_enhancers, node_key
+from src.pipeline.disk import DiskCache, parse_size
+
+
+class Terminal:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_render_cache_eviction():
+    image = Image.new("RGBA", (10, 10))
+    cache = RenderCache(max_bytes=image_size(image) * 2)
+    keys = [node_key("Input", "blur_" + str(idx), {"blur_percentage_" + str(idx): idx}) for idx in range(3)]
+
+    cache.put(keys[0], image)
+    cache.put(keys[1], image)
+    assert cache.get(keys[0]) is image
+
+    cache.put(keys[2], image)
+    assert keys[1] not in cache
+    assert keys[0] in cache and keys[2] in cache
+    assert cache.size == image_size(image) * 2
+
+
+def test_disk_cache(tmp_path):
+    image = Image.linear_gradient("L").convert("RGBA")
+    # Two images fit below the three quarters eviction goes down to
+    cache = DiskCache(tmp_path, max_bytes=(image_size(image) * 2 + 100) * 4 // 3)
+
+    cache.put("first", image)
+    assert cache.get("first").tobytes() == image.tobytes()
+    assert cache.get("missing") is None
+
+    cache.put("second", image)
+    os.utime(cache._path("first"), (0, 0))
+    cache.put("third", image)
+    assert cache.get("first") is None
+    assert cache.get("second") is not None and cache.get("third") is not None
+    # Eviction leaves room, and a new cache on the same directory starts from what's there
+    assert cache.size <= cache.max_bytes * 3 // 4
+    assert DiskCache(tmp_path, cache.max_bytes).size == cache.size
+
+
+def test_disk_cache_previews(tmp_path):
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    pipeline.add_node("brightness_0", BrightnessModule(), {"brightness_percentage": 30})
+    pipeline.add_node("Output", Terminal("Output"))
+    pipeline.add_link("Input", "brightness_0")
+    pipeline.add_link("brightness_0", "Output")
+    executor = Executor(RenderCache(), disk=DiskCache(tmp_path))
+    image = Image.new("RGB", (200, 100))
+
+    # Only full size renders are written, previews would fill the cache on every slider step
+    executor.run(pipeline, image, (50, 50))
+    assert executor.disk.size == 0
+    executor.run(pipeline, image)
+    assert executor.disk.size > 0
+
+
+def test_parse_size():
+    assert parse_size("1000") == 1000
+    assert parse_size("512M") == parse_size("0.5g") == 512 * 1024 * 1024
+    assert parse_size("2GiB") == 2 * 1024 * 1024 * 1024
+
+
+def test_enhancer_cache():
+    created = []
+    cache = EnhancerCache(lambda image: created.append(image) or ImageEnhance.Contrast(image))
+    images = [Image.linear_gradient("L").convert("RGBA") for _ in range(3)]
+
+    with keep_enhancers():
+        assert cache.get(images[0]) is cache.get(images[0])
+        assert cache.get(images[0]).enhance(1.5) == ImageEnhance.Contrast(images[0]).enhance(1.5)
+        cache.get(images[1])
+        cache.get(images[2])
+        cache.get(images[0])
+    assert len(created) == 4
+
+    # Outside of renders that cache their nodes nothing is kept, and clearing drops what was
+    assert cache.get(images[0]) is not cache.get(images[0])
+    clear_enhancers()
+    with keep_enhancers():
+        cache.get(images[0])
+    assert len(created) == 7
+
+
+def test_executor_enhancers():
+    brightness = BrightnessModule()
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    pipeline.add_node("brightness_0", brightness, {"brightness_percentage": 30})
+    pipeline.add_node("Output", Terminal("Output"))
+    pipeline.add_link("Input", "brightness_0")
+    pipeline.add_link("brightness_0", "Output")
+
+    executor = Executor(RenderCache(), optimize=False)
+    for _ in range(3):
+        executor.run(pipeline, Image.new("RGB", (20, 10)))
+        # A new source drops the enhancers of the previous ones
+        assert len(brightness.enhancers._items) == 1
+
+    brightness.enhancers.clear()
+    Executor(optimize=False).run(pipeline, Image.new("RGB", (20, 10)))
+    assert not brightness.enhancers._items
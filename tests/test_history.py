@@ -0,0 +1,104 @@
+import dearpygui.dearpygui as dpg
+
+from src.utils.nodes import HistoryItem, HistoryManager, Update, history_manager
+
+
+def update(value, old):
+    return HistoryItem(tag="blur_0", action="update", data={"blur_percentage_0": (value, old)})
+
+
+def test_history_merges_updates():
+    history = HistoryManager()
+    for value in range(2, 50):
+        history.append(update(value, value - 1))
+    assert len(history.history) == 1
+    assert history.current.data == {"blur_percentage_0": (49, 1)}
+
+    history.merge_window = 0
+    history.append(update(50, 49))
+    assert len(history.history) == 2
+
+
+def test_history_is_bounded():
+    history = HistoryManager(max_items=10, merge_window=-1)
+    for value in range(25):
+        history.append(update(value, value - 1))
+    assert len(history.history) == 10
+    assert history.index == 9
+    assert history.history[0].data["blur_percentage_0"][0] == 15
+
+    history.max_bytes = history.size // 2
+    history.append(update(25, 24))
+    assert history.size <= history.max_bytes
+    assert history.current.data["blur_percentage_0"][0] == 25
+
+
+def test_batch_runs_updates_once():
+    update = Update()
+    calls = []
+
+    def stub(name):
+        method = getattr(update, name)
+
+        def call(*args, **kwargs):
+            calls.append((name, update._batch > 0))
+            return method(*args, **kwargs)
+
+        return call
+
+    update.update_path = stub("update_path")
+    update.update_output = stub("update_output")
+    with update.batch():
+        with update.batch():
+            update.update_path()
+            update.update_output()
+            update.update_output()
+        update.update_path()
+        assert all(deferred for _, deferred in calls)
+
+    # Everything asked for in the batch runs once when the outermost one ends, the path first
+    assert [name for name, deferred in calls if not deferred] == ["update_path", "update_output"]
+    calls.clear()
+    with update.batch():
+        pass
+    assert calls == []
+
+
+def test_batch_history_is_one_step(monkeypatch):
+    values = {}
+    outputs = []
+    monkeypatch.setattr(dpg, "set_value", values.__setitem__)
+    editor = Update()
+    editor.update_path = lambda: None
+    editor.update_output = lambda *args: outputs.append(args)
+    monkeypatch.setattr(history_manager, "batch", editor.batch)
+    monkeypatch.setattr(history_manager, "update_output", editor.update_output)
+    history_manager.clear()
+
+    history_manager.append(update(2, 1))
+    with editor.batch():
+        history_manager.append(HistoryItem(tag="blur_0", action="update", data={"blur_mode_0": ("Box", "Gaussian")}))
+        history_manager.append(HistoryItem(tag="contrast_0", action="update", data={"contrast_0": (50, 100)}))
+    assert len(history_manager.history) == 3
+
+    history_manager.undo()
+    assert history_manager.index == 0
+    assert values == {"blur_mode_0": "Gaussian", "contrast_0": 100}
+    history_manager.undo()
+    assert history_manager.index == -1
+    assert values["blur_percentage_0"] == 1
+
+    history_manager.redo()
+    assert history_manager.index == 0
+    history_manager.redo()
+    assert history_manager.index == 2
+    assert values == {"blur_percentage_0": 2, "blur_mode_0": "Box", "contrast_0": 50}
+    assert [key for key, *_ in outputs] == [
+        "contrast_0",
+        "blur_mode_0",
+        "blur_percentage_0",
+        "blur_percentage_0",
+        "blur_mode_0",
+        "contrast_0",
+    ]
+    history_manager.clear()
@@ -0,0 +1,19 @@
+from src.utils.links import Link, LinkGraph
+
+
+def test_link_graph():
+    links = LinkGraph()
+    links.add(Link(source=1, target=2, id=10))
+    links.add(Link(source=1, target=3, id=11))
+    assert [link.id for link in links.out_of(1)] == [10, 11]
+
+    # An input only takes one link
+    links.add(Link(source=4, target=3, id=12))
+    assert 11 not in links
+    assert links.into(3).id == 12
+    assert links.find(1, 2).id == 10
+
+    for link in links.attached([1, 3]):
+        links.remove(link)
+    assert len(links) == 0
+    assert links.out_of(1) == []
@@ -0,0 +1,390 @@
+from itertools import pairwise
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+from src.corenodes.transform import (
+    BlurModule,
+    BrightnessModule,
+    ContrastModule,
+    CropModule,
+    FlipModule,
+    OpacityModule,
+    ResizeModule,
+    RotateModule,
+    SharpnessModule,
+)
+from src.pipeline import (
+    Executor,
+    Pipeline,
+    Plan,
+    RenderCache,
+    fuse_geometric,
+    fuse_pointwise,
+    native,
+    push_down,
+    skip_identities,
+)
+from src.utils.nodes import NodeParent
+
+
+class Terminal:
+    def __init__(self, name):
+        self.name = name
+
+
+def make_pipeline():
+    return Pipeline.load(
+        {
+            "nodes": {
+                "Input": {"settings": {}},
+                "blur_0": {"settings": {"blur_0": {"blur_mode_0": "Gaussian", "blur_percentage_0": 100}}},
+                "resize_0": {
+                    "settings": {"resize_0": {"width_size_0": 64, "height_size_0": 32, "resize_percentage_0": 50}}
+                },
+                "crop_0": {"settings": {"crop_0": {"left_0": 0, "top_0": 0, "right_0": 16, "bottom_0": 8}}},
+                "Output": {"settings": {}},
+            },
+            "links": [
+                {"source": "Input", "target": "Blur"},
+                {"source": "Blur", "target": "Resize"},
+                {"source": "Resize", "target": "Crop"},
+                {"source": "Crop", "target": "Output"},
+            ],
+        },
+        [Terminal("Input"), BlurModule(), ResizeModule(), CropModule(), Terminal("Output")],
+    )
+
+
+def test_pipeline_chain():
+    chain = make_pipeline().chain()
+    assert [node.tag for node in chain] == ["blur_0", "resize_0", "crop_0"]
+    assert chain[1].params == {"width_size": 64, "height_size": 32, "resize_percentage": 50}
+
+
+def test_executor():
+    pipeline = make_pipeline()
+    executor = Executor(RenderCache())
+    image = Image.new("RGBA", (100, 100), (255, 0, 0, 255))
+
+    assert executor.run(pipeline, image)["Output"].size == (16, 8)
+    # Resize and Crop are fused into a single node
+    assert len(executor.cache) == 2
+    assert executor.output_size(pipeline.chain(), image.size) == (16, 8)
+    assert executor.run(pipeline, image, preview_size=(50, 50))["Output"].size == (8, 4)
+
+
+def test_plan():
+    plan = Plan(make_pipeline())
+    assert plan.steps((100, 100)) is plan.steps((100, 100))
+
+    cropped = plan.update("crop_0", {"left": 0, "top": 0, "right": 4, "bottom": 4})
+    assert cropped.fingerprint != plan.fingerprint
+    assert plan.update("crop_0", dict(plan.nodes["crop_0"].params)).fingerprint == plan.fingerprint
+    image = Image.new("RGBA", (100, 100))
+    assert Executor().run(cropped, image)["Output"].size == (4, 4)
+    assert Executor().run(plan, image)["Output"].size == plan.output_size("Output", image.size) == (16, 8)
+
+
+def test_executor_branches():
+    pipeline = make_pipeline()
+    pipeline.add_node("Output_1", Terminal("Output"))
+    pipeline.add_link("blur_0", "Output_1")
+    calls = []
+    blur = pipeline.nodes["blur_0"].module
+    blur.process = lambda image, params: calls.append(params) or image
+
+    images = Executor().run(pipeline, Image.new("RGBA", (100, 100)))
+    assert images["Output"].size == (16, 8)
+    assert images["Output_1"].size == (100, 100)
+    assert len(calls) == 1
+
+
+def test_pointwise_fusion():
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    pipeline.add_node("brightness_0", BrightnessModule(), {"brightness_percentage": 30})
+    pipeline.add_node("contrast_0", ContrastModule(), {"contrast_percentage": 40})
+    pipeline.add_node("opacity_0", OpacityModule(), {"opacity_percentage": 60})
+    pipeline.add_node("Output", Terminal("Output"))
+    for source, target in [("Input", "brightness_0"), ("brightness_0", "contrast_0"), ("contrast_0", "opacity_0")]:
+        pipeline.add_link(source, target)
+    pipeline.add_link("opacity_0", "Output")
+
+    assert [node.tag for node in fuse_pointwise(pipeline.chains())["Output"]] == ["brightness_0+contrast_0+opacity_0"]
+    image = Image.linear_gradient("L").convert("RGBA")
+    fused = Executor().run(pipeline, image)["Output"]
+    unfused = Executor(optimize=False).run(pipeline, image)["Output"]
+    assert fused.getchannel("A") == unfused.getchannel("A")
+    assert max(abs(a - b) for a, b in zip(fused.tobytes(), unfused.tobytes(), strict=True)) <= 1
+
+
+def test_geometric_fusion():
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    pipeline.add_node("rotate_0", RotateModule(), {"rotate_degrees": 30})
+    pipeline.add_node("flip_0", FlipModule(), {"flip_mode": "Horizontal"})
+    pipeline.add_node("crop_0", CropModule(), {"left": 10, "top": 20, "right": 90, "bottom": 60})
+    pipeline.add_node("Output", Terminal("Output"))
+    for source, target in [("Input", "rotate_0"), ("rotate_0", "flip_0"), ("flip_0", "crop_0"), ("crop_0", "Output")]:
+        pipeline.add_link(source, target)
+
+    assert [node.tag for node in fuse_geometric(pipeline.chains())["Output"]] == ["rotate_0+flip_0+crop_0"]
+    image = Image.radial_gradient("L").resize((120, 80)).convert("RGBA")
+    fused = Executor().run(pipeline, image)["Output"]
+    assert fused.size == (80, 40)
+    assert fused == Executor(optimize=False).run(pipeline, image)["Output"]
+
+
+def make_chain(*nodes):
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    source = "Input"
+    for index, (module, params) in enumerate(nodes):
+        tag = f"{module.name.lower()}_{index}"
+        pipeline.add_node(tag, module, params)
+        pipeline.add_link(source, tag)
+        source = tag
+    pipeline.add_node("Output", Terminal("Output"))
+    pipeline.add_link(source, "Output")
+    return pipeline
+
+
+def transparent(image):
+    return image.getchannel("A").histogram()[0] if "A" in image.getbands() else 0
+
+
+def test_geometric_fusion_clips():
+    image = Image.new("RGB", (100, 100), "red")
+    image.paste((0, 0, 255), (40, 40, 60, 60))
+
+    # The crop drops all of the red, even where the rotation would bring it back into view
+    pipeline = make_chain(
+        (CropModule(), {"left": 40, "top": 40, "right": 60, "bottom": 60}), (RotateModule(), {"rotate_degrees": 45})
+    )
+    fused = Executor().run(pipeline, image)["Output"]
+    assert fused == Executor(optimize=False).run(pipeline, image)["Output"]
+    assert (255, 0, 0, 255) not in [color for _, color in fused.getcolors()]
+
+    # The corners the first rotation leaves empty stay empty after turning back
+    pipeline = make_chain((RotateModule(), {"rotate_degrees": 30}), (RotateModule(), {"rotate_degrees": 330}))
+    fused = Executor().run(pipeline, image)["Output"]
+    unfused = Executor(optimize=False).run(pipeline, image)["Output"]
+    assert abs(transparent(fused) - transparent(unfused)) < 0.02 * transparent(unfused)
+
+
+def test_right_angle_clips():
+    # Turning a non-square image drops what no longer fits, a single transpose would keep it.
+    # With an odd difference between width and height every turn also rounds by half a pixel
+    for size in [(90, 60), (91, 60), (144, 115), (60, 91)]:
+        image = Image.effect_noise(size, 64).convert("RGB")
+        for nodes in [
+            [
+                (CropModule(), {"left": 2, "top": 31, "right": 59, "bottom": 40}),
+                (RotateModule(), {"rotate_degrees": 90}),
+            ],
+            [(RotateModule(), {"rotate_degrees": 90}), (RotateModule(), {"rotate_degrees": 90})],
+            [(RotateModule(), {"rotate_degrees": 270}), (FlipModule(), {"flip_mode": "Vertical"})],
+        ]:
+            pipeline = make_chain(*nodes)
+            fused = Executor().run(pipeline, image)["Output"]
+            assert fused == Executor(optimize=False).run(pipeline, image)["Output"]
+            assert transparent(fused) > 0
+
+
+def test_anisotropic_fusion():
+    # Stripes across the axis that isn't shrunk have to survive a fused rotation and one-axis downscale
+    stripes = Image.new("L", (1, 400))
+    stripes.putdata([255 * (row // 2 % 2) for row in range(400)])
+    stripes = stripes.resize((3000, 400), Image.NEAREST)
+    pipeline = make_chain(
+        (RotateModule(), {"rotate_degrees": 3}),
+        (ResizeModule(), {"width_size": 300, "height_size": 400, "resize_percentage": 100}),
+        (CropModule(), {"left": 20, "top": 20, "right": 280, "bottom": 380}),
+    )
+    fused = Executor().run(pipeline, stripes)["Output"].convert("L")
+    unfused = Executor(optimize=False).run(pipeline, stripes)["Output"].convert("L")
+    assert ImageStat.Stat(fused).stddev[0] > 0.85 * ImageStat.Stat(unfused).stddev[0]
+    assert ImageStat.Stat(ImageChops.difference(fused, unfused)).mean[0] < 20
+
+
+def test_push_down():
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    pipeline.add_node("blur_0", BlurModule(), {"blur_mode": "Gaussian", "blur_percentage": 130})
+    pipeline.add_node("sharpness_0", SharpnessModule(), {"sharpness_percentage": 60})
+    pipeline.add_node("crop_0", CropModule(), {"left": 30, "top": 0, "right": 60, "bottom": 20})
+    pipeline.add_node("Output", Terminal("Output"))
+    for source, target in [
+        ("Input", "blur_0"),
+        ("blur_0", "sharpness_0"),
+        ("sharpness_0", "crop_0"),
+        ("crop_0", "Output"),
+    ]:
+        pipeline.add_link(source, target)
+
+    chain = push_down(pipeline.chains(), (100, 100))["Output"]
+    assert [node.tag for node in chain] == ["crop_0", "blur_0", "sharpness_0", "crop_0_inner"]
+    assert chain[0].params == {"left": 22, "top": 0, "right": 68, "bottom": 28}
+    image = Image.effect_noise((100, 100), 64).convert("RGBA")
+    assert Executor().run(pipeline, image)["Output"] == Executor(optimize=False).run(pipeline, image)["Output"]
+
+
+def test_frozen():
+    pipeline = make_pipeline()
+    calls = []
+    blur = pipeline.nodes["blur_0"].module
+    blur.process = lambda image, params: calls.append(params) or image
+
+    plan = Plan(pipeline, frozen={"blur_0"})
+    assert [step.tag for step in plan.steps((100, 100))["Output"]] == ["blur_0", "resize_0+crop_0"]
+
+    executor = Executor()
+    image = Image.new("RGBA", (100, 100))
+    executor.run(plan, image)
+    cropped = executor.run(plan.update("crop_0", {"left": 0, "top": 0, "right": 4, "bottom": 4}), image)
+    assert cropped["Output"].size == (4, 4)
+    assert len(calls) == 1
+
+    executor.run(plan.update("blur_0", {"blur_mode": "Box", "blur_percentage": 10}), image)
+    assert len(calls) == 2
+
+
+def test_large_blur():
+    edges = Image.new("RGB", (800, 600))
+    edges.paste((255, 255, 255), (0, 0, 800, 1))
+    images = [
+        Image.effect_mandelbrot((300, 200), (-2, -1.2, 1, 1.2), 100).convert("RGBA"),
+        # High frequencies are what a reduced copy loses, and Pillow repeats the edge pixels after every pass
+        Image.effect_noise((800, 600), 100).convert("RGB"),
+        Image.merge("RGBA", [Image.effect_noise((400, 300), 128) for _ in range(4)]),
+        edges,
+    ]
+    blur = BlurModule()
+    for image in images:
+        for percentage in (100, 260, 390, 500):
+            blurred = blur.process(image, {"blur_mode": "Gaussian", "blur_percentage": percentage})
+            exact = image.filter(ImageFilter.GaussianBlur(percentage / 65))
+            assert max(high for _, high in ImageChops.difference(blurred, exact).getextrema()) <= 5
+
+
+def test_resize_quality():
+    image = Image.effect_mandelbrot((1200, 800), (-2, -1.2, 1, 1.2), 100).convert("RGBA")
+    resize = ResizeModule()
+    params = {"width_size": 120, "height_size": 80, "resize_percentage": 100}
+    best = resize.process(image, {**params, "resize_quality": "Best"})
+    assert best == image.resize((120, 80), Image.LANCZOS)
+    for quality in ("Balanced", "Fast"):
+        resized = resize.process(image, {**params, "resize_quality": quality})
+        assert resized.size == (120, 80)
+        assert resized != best
+    assert max(high for _, high in ImageChops.difference(resize.process(image, params), best).getextrema()) <= 4
+
+
+def test_skip_identities():
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    pipeline.add_node("brightness_0", BrightnessModule(), {"brightness_percentage": 25})
+    pipeline.add_node("rotate_0", RotateModule(), {"rotate_degrees": 360})
+    pipeline.add_node("crop_0", CropModule(), {"left": 0, "top": 0, "right": 120, "bottom": 80})
+    pipeline.add_node("rotate_1", RotateModule(), {"rotate_degrees": 90})
+    pipeline.add_node("flip_0", FlipModule(), {"flip_mode": "Diagonal"})
+    pipeline.add_node("Output", Terminal("Output"))
+    for source, target in pairwise(pipeline.nodes):
+        pipeline.add_link(source, target)
+
+    chain = skip_identities(pipeline.chains(), (120, 80))["Output"]
+    assert [node.tag for node in chain] == ["rotate_1", "flip_0"]
+    image = Image.effect_noise((120, 80), 64).convert("RGBA")
+    assert Executor().run(pipeline, image)["Output"] == Executor(optimize=False).run(pipeline, image)["Output"]
+
+    # Nothing is left to run, so the input itself is the output
+    pipeline.links = pipeline.links[:3]
+    pipeline.add_link("crop_0", "Output")
+    assert Executor().run(pipeline, image)["Output"] is image
+
+
+def test_native_modes():
+    gray = Image.linear_gradient("L")
+    assert native(gray) is gray
+    assert native(gray.convert("RGBA")).mode == "RGB"
+    assert native(gray.convert("I")).mode == "L"
+    assert native(gray.convert("P")).mode == "RGB"
+    assert native(Image.merge("LA", (gray, gray))).mode == "LA"
+
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    pipeline.add_node("contrast_0", ContrastModule(), {"contrast_percentage": 40})
+    pipeline.add_node("opacity_0", OpacityModule(), {"opacity_percentage": 60})
+    pipeline.add_node("Output", Terminal("Output"))
+    pipeline.add_link("Input", "contrast_0")
+    pipeline.add_link("contrast_0", "Output")
+    assert Executor().run(pipeline, gray)["Output"].mode == "L"
+
+    # Only nodes that change the alpha add it
+    pipeline.links.pop()
+    pipeline.add_link("contrast_0", "opacity_0")
+    pipeline.add_link("opacity_0", "Output")
+    output = Executor().run(pipeline, gray)["Output"]
+    assert output.mode == "LA"
+    assert output.convert("RGBA") == Executor().run(pipeline, gray.convert("RGBA"))["Output"]
+
+
+def test_node_modes():
+    class Swap(NodeParent):
+        name = "Swap"
+
+        def process(self, image, params):
+            r, g, b, a = image.split()
+            return Image.merge("RGBA", (b, g, r, a))
+
+    pipeline = make_chain((Swap(), {}), (FlipModule(), {"flip_mode": "Horizontal"}))
+    # Nodes that don't declare their modes get RGBA, the core nodes keep the mode they're given
+    for mode in ("L", "LA", "RGB"):
+        image = Image.linear_gradient("L").convert(mode)
+        assert Executor().run(pipeline, image)["Output"].mode == "RGBA"
+        assert Executor().run(make_chain((FlipModule(), {"flip_mode": "Horizontal"})), image)["Output"].mode == mode
+
+
+def test_legacy_plugin():
+    class Legacy(NodeParent):
+        name = "Legacy"
+
+        def run(self, image, tag):
+            return image.rotate(self.settings[tag]["legacy_degrees_0"])
+
+    legacy = Legacy()
+    legacy.settings["legacy_0"] = {"legacy_degrees_0": 180}
+    pipeline = Pipeline()
+    pipeline.add_node("Input", Terminal("Input"))
+    pipeline.add_node("legacy_0", legacy, {"legacy_degrees": 180})
+    pipeline.add_node("Output", Terminal("Output"))
+    pipeline.add_link("Input", "legacy_0")
+    pipeline.add_link("legacy_0", "Output")
+
+    # Written for RGBA images, so that's what it gets
+    image = Image.linear_gradient("L")
+    assert Executor().run(pipeline, image)["Output"] == image.convert("RGBA").rotate(180)
+
+
+def test_legacy_plugin_headless():
+    class Legacy(NodeParent):
+        name = "Invert"
+
+        def run(self, image, tag):
+            if not self.settings[tag]["invert_enabled_0"]:
+                return image
+            r, g, b, a = image.split()
+            return Image.merge("RGBA", [band.point(lambda value: 255 - value) for band in (r, g, b)] + [a])
+
+    data = {
+        "nodes": {
+            "Input": {"settings": {}},
+            "invert_0": {"settings": {"invert_0": {"invert_enabled_0": True}}},
+            "Output": {"settings": {}},
+        },
+        "links": [{"source": "Input", "target": "Invert"}, {"source": "Invert", "target": "Output"}],
+    }
+    pipeline = Pipeline.load(data, [Terminal("Input"), Legacy(), Terminal("Output")])
+    image = Image.linear_gradient("L")
+    inverted = Image.merge("RGBA", [image.point(lambda value: 255 - value)] * 3 + [Image.new("L", image.size, 255)])
+    assert Executor().run(pipeline, image)["Output"] == inverted
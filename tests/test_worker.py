@@ -0,0 +1,103 @@
+import threading
+
+from PIL import Image
+
+from src.corenodes.transform import BrightnessModule
+from src.modules import Terminal
+from src.pipeline import CancelToken, Pipeline, Plan
+from src.utils.nodes import Update
+from src.utils.worker import RenderWorker
+
+
+def test_render_worker():
+    worker = RenderWorker()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow(token):
+        calls.append("slow")
+        started.set()
+        release.wait(5)
+        token.check()
+        return "slow"
+
+    def job(name):
+        return lambda token: calls.append(name) or name
+
+    worker.submit(slow)
+    assert started.wait(5)
+    # Submitting cancels the running job, and only the newest of the pending ones is run
+    worker.submit(job("first"))
+    worker.submit(job("second"))
+    release.set()
+    assert worker.wait(5)
+    assert calls == ["slow", "second"]
+    assert worker.take() == "second"
+    assert worker.take() is None
+
+    worker.submit(job("third"))
+    assert worker.wait(5)
+    worker.clear()
+    assert worker.take() is None
+
+    # A published result replaces the one of the job that's running
+    worker.submit(slow)
+    worker.publish("cached")
+    assert worker.wait(5)
+    assert worker.take() == "cached"
+
+
+def test_cached_previews():
+    pipeline = Pipeline.load(
+        {
+            "nodes": {
+                "Input": {"settings": {}},
+                "brightness_0": {"settings": {"brightness_0": {"brightness_percentage_0": 50}}},
+                "Output": {"settings": {}},
+            },
+            "links": [
+                {"source": "Input", "target": "Brightness"},
+                {"source": "Brightness", "target": "Output"},
+            ],
+        },
+        [Terminal("Input"), BrightnessModule(), Terminal("Output")],
+    )
+    update = Update()
+    update.plan = Plan(pipeline)
+    source = Image.new("RGBA", (40, 30), (100, 50, 25, 255))
+    update.snapshot = lambda: (source, update.plan)
+    submitted = []
+
+    # Renders right away instead of on the worker's thread
+    def submit(job):
+        submitted.append(job)
+        update.worker.publish(job(CancelToken()))
+
+    update.worker.submit = submit
+
+    def edit(value):
+        update.plan = update.plan.update("brightness_0", {"brightness_percentage": value})
+        update.update_output()
+        return update.worker.take()
+
+    update.update_output()
+    first = update.worker.take()
+    assert len(submitted) == 1
+    assert first["Output"][0].getpixel((0, 0)) == (200, 100, 50, 255)
+    edit(100)
+    assert len(submitted) == 2
+
+    # Going back to a state that was shown before, e.g. with undo, publishes its preview without rendering
+    cached = edit(50)
+    assert len(submitted) == 2
+    assert cached["Output"][0] is first["Output"][0]
+    assert cached["Output"][1:] == ((40, 30), (40, 30))
+
+    # A new Input image drops the previews of the old one
+    source = Image.new("RGBA", (40, 30), (10, 10, 10, 255))
+    update.update_output()
+    assert len(submitted) == 3
+    assert update.worker.take()["Output"][0].getpixel((0, 0)) == (20, 20, 20, 255)
+    edit(100)
+    assert len(submitted) == 4